@@ -0,0 +1,433 @@
+import os
+import io
+import sys
+import json
+import time
+import signal
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import multiprocessing
+import subprocess
+import contextlib
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ⏱️ Offline render benchmark.
+#    Runs generate_video_from_images() end to end against local stand-ins:
+#      - product images / logo from a local HTTP server (synthetic, deterministic)
+#      - Gemini replaced by a canned script of the right length
+#      - TTS replaced by an ffmpeg sine tone of a fixed duration
+#    and times every stage across a matrix of image counts, durations,
+#    rendition sets and render modes. Results are JSON so CI can diff them:
+#
+#      python benchmark.py --output bench.json
+#      python benchmark.py --baseline bench.json --max-regression 0.25   # exit 1 when slower
+#
+#    Caches live in a throwaway CACHE_DIR and are emptied before every run
+#    (--warm keeps them, to measure the cache-hit path). Nothing touches
+#    Mongo, Redis or the network. Every run is a forked child with its own
+#    process group: one that exceeds --case-timeout is killed together with
+#    its ffmpeg processes and reported as failed.
+
+# Stage -> utils function(s) timed for it. Nested calls of the same stage are
+# counted once. "resize" runs inside "download" (summed over the download
+# threads) and "overlay" inside "encode".
+STAGE_FUNCTIONS = {
+    "download": ["fetch_images"],
+    "resize": ["letterbox_image"],
+    "script": ["generate_script"],
+    "tts": ["synthesize_voiceover"],
+    "outro": ["create_outro_image", "render_outro_frame"],
+    "overlay": ["create_template_overlay"],
+    "encode": ["encode_video", "encode_video_segments"],
+}
+STAGES = list(STAGE_FUNCTIONS)
+RESULT_VERSION = 1 # bump when the JSON layout changes
+
+DEFAULT_IMAGES = "3,6"
+DEFAULT_DURATIONS = "10,20"
+DEFAULT_RENDITIONS = "9x16_480;9x16_480+9x16_1080"
+DEFAULT_MODES = "files,stream,segments"
+
+
+# --- Stand-ins ---
+class StageTimer:
+    """Thread-safe wall-clock totals per stage, reset before every run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.seconds = {stage: 0.0 for stage in STAGES}
+            self.calls = {stage: 0 for stage in STAGES}
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            active = getattr(self._active, "stages", None)
+            if active is None: active = self._active.stages = set()
+            if stage in active: return fn(*args, **kwargs) # e.g. create_outro_image -> render_outro_frame
+            active.add(stage)
+            started = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                active.discard(stage)
+                with self._lock:
+                    self.seconds[stage] += elapsed
+                    self.calls[stage] += 1
+        timed.__wrapped__ = fn
+        return timed
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: round(s, 4) for stage, s in self.seconds.items()}, dict(self.calls)
+
+
+class StubGeminiModel:
+    """Stands in for genai.GenerativeModel: returns a script of the requested length."""
+    latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, prompt):
+        if self.latency: time.sleep(self.latency)
+        words = 30
+        for part in prompt.split("~")[1:]:
+            head = part.split(" ", 1)[0]
+            if head.isdigit(): words = int(head)
+        text = " ".join(("Benchmark product copy, spoken clearly for every shopper." for _ in range(words // 8 + 1))).split()[:words]
+        return type("StubResponse", (), {"text": " ".join(text)})()
+
+
+class StubTTSEngine:
+    """Stands in for the pyttsx3 engine: writes an ffmpeg sine tone of `seconds` instead of speech."""
+    seconds = 15.0
+
+    def __init__(self):
+        self._pending = []
+
+    def setProperty(self, name, value):
+        pass
+
+    def getProperty(self, name):
+        return [] if name == "voices" else None
+
+    def save_to_file(self, text, path):
+        self._pending.append(path)
+
+    def runAndWait(self):
+        pending, self._pending = self._pending, []
+        for path in pending:
+            subprocess.run(
+                ['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', f'sine=frequency=220:duration={self.seconds}',
+                 '-ac', '1', '-ar', '22050', path],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """GET /product/<n>.jpg and /logo.png, generated once and served with an ETag."""
+    source_size = (1200, 1200)
+    _cache = {}
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    @classmethod
+    def render(cls, path):
+        from PIL import Image, ImageDraw
+        with cls._lock:
+            if path in cls._cache: return cls._cache[path]
+        buf = io.BytesIO()
+        if path == "/logo.png":
+            img = Image.new("RGBA", (400, 400), (0, 0, 0, 0))
+            ImageDraw.Draw(img).ellipse([20, 20, 380, 380], fill=(255, 215, 0, 255))
+            img.save(buf, "PNG")
+            content_type = "image/png"
+        elif path.startswith("/product/") and path.endswith(".jpg") and path[9:-4].isdigit():
+            n = int(path[9:-4])
+            w, h = cls.source_size
+            # Gradient + shapes so the JPEG/x264 work looks like a product shot, not a flat fill
+            img = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+            draw = ImageDraw.Draw(img)
+            hue = (n * 67) % 255
+            draw.rectangle([w // 6, h // 6, w * 5 // 6, h * 5 // 6], fill=(hue, 255 - hue, (hue * 3) % 255))
+            draw.ellipse([w // 3, h // 3, w * 2 // 3, h * 2 // 3], fill=(255 - hue, hue, 128))
+            img.save(buf, "JPEG", quality=90)
+            content_type = "image/jpeg"
+        else:
+            return None
+        body = buf.getvalue()
+        entry = (body, content_type, f'"{hashlib.sha256(body).hexdigest()[:16]}"')
+        with cls._lock: cls._cache[path] = entry
+        return entry
+
+    def do_GET(self):
+        entry = self.render(self.path.split("?", 1)[0])
+        if not entry:
+            self.send_response(404); self.end_headers()
+            return
+        body, content_type, etag = entry
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304); self.send_header("ETag", etag); self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_image_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="bench-image-server").start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def make_music_bed(path, seconds):
+    subprocess.run(
+        ['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}', '-ac', '2', '-ar', '44100', path],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    return path
+
+
+# --- Harness ---
+def install_stubs(utils, timer, script_latency):
+    """Swaps the network/TTS dependencies for stand-ins and wraps every timed stage."""
+    StubGeminiModel.latency = script_latency
+    utils.genai.GenerativeModel = StubGeminiModel
+    utils.get_cached_script = lambda key: None # no Redis: every run pays for the (stubbed) script call
+    utils.store_script = lambda key, script: None
+    utils._tts_engine = StubTTSEngine()
+    for stage, names in STAGE_FUNCTIONS.items():
+        for name in names: setattr(utils, name, timer.wrap(stage, getattr(utils, name)))
+
+def clear_caches(utils):
+    """Cold start: empty the disk caches and the in-process overlay map."""
+    import media_cache
+    for cache in (media_cache.image_cache, media_cache.voice_cache, media_cache.segment_cache):
+        shutil.rmtree(cache.root, ignore_errors=True)
+        os.makedirs(cache.root, exist_ok=True)
+    with utils._overlay_lock:
+        utils._overlay_cache.clear()
+        shutil.rmtree(utils.OVERLAY_DIR, ignore_errors=True)
+        os.makedirs(utils.OVERLAY_DIR, exist_ok=True)
+
+def output_files(utils, output_name, renditions):
+    return [os.path.join(utils.VIDEO_DIR, utils.rendition_filename(output_name, name, k)) for k, name in enumerate(renditions)]
+
+def run_case(utils, timer, base_url, case, template_id, bgm_path, warm):
+    if not warm: clear_caches(utils)
+    StubTTSEngine.seconds = case["duration"]
+    renditions = utils.resolve_renditions(case["renditions"])
+    image_urls = [f"{base_url}/product/{n}.jpg" for n in range(case["images"])]
+    stats = {}
+
+    def on_progress(progress, stage=None, **fields):
+        if "encode_stats" in fields: stats.update(fields["encode_stats"])
+
+    timer.reset()
+    started = time.perf_counter()
+    # utils logs to stdout; keep stdout clean for the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        output_name, script = utils.generate_video_from_images(
+            image_urls, "Benchmark Product", "<p>Synthetic product used by benchmark.py</p>", logo_url=f"{base_url}/logo.png",
+            target_duration=case["duration"], progress_callback=on_progress, bgm_file_path=bgm_path,
+            template_id=template_id, regenerate=True, render_mode=case["render_mode"], renditions=renditions,
+        )
+    wall = time.perf_counter() - started
+    seconds, calls = timer.snapshot()
+
+    sizes = {}
+    error = None if output_name else (script or "render returned no file")
+    if output_name:
+        for name, path in zip(renditions, output_files(utils, output_name, renditions)):
+            if os.path.exists(path):
+                sizes[name] = os.path.getsize(path)
+                os.remove(path)
+    return {
+        **case,
+        "renditions": renditions,
+        "ok": bool(output_name) and len(sizes) == len(renditions),
+        "error": error,
+        "wall_seconds": round(wall, 4),
+        "stages": seconds,
+        "calls": calls,
+        "encode_stats": stats,
+        "output_bytes": sizes,
+    }
+
+def failed_case(case, error, wall):
+    return {
+        **case, "ok": False, "error": error, "wall_seconds": round(wall, 4),
+        "stages": {stage: 0.0 for stage in STAGES}, "calls": {stage: 0 for stage in STAGES},
+        "encode_stats": {}, "output_bytes": {},
+    }
+
+def run_case_isolated(utils, timer, base_url, case, template_id, bgm_path, warm, timeout):
+    """run_case() in a forked child; a child still busy after `timeout` seconds is killed with its whole process group."""
+    ctx = multiprocessing.get_context("fork")
+    receiver, sender = ctx.Pipe(duplex=False)
+
+    def child():
+        os.setpgrp() # ffmpeg inherits the group, so killpg() reaches it too
+        try: result = run_case(utils, timer, base_url, case, template_id, bgm_path, warm)
+        except Exception as e: result = failed_case(case, f"{type(e).__name__}: {e}", 0)
+        sender.send(result)
+
+    started = time.perf_counter()
+    proc = ctx.Process(target=child, name="bench-case")
+    proc.start()
+    sender.close()
+    try:
+        if receiver.poll(timeout): return receiver.recv()
+        return failed_case(case, f"timed out after {timeout:g}s", time.perf_counter() - started)
+    except EOFError:
+        return failed_case(case, f"case process died (exit code {proc.exitcode})", time.perf_counter() - started)
+    finally:
+        try: os.killpg(proc.pid, signal.SIGKILL) # no-op for a clean exit, ends a stuck encode otherwise
+        except (ProcessLookupError, PermissionError): proc.kill()
+        proc.join()
+
+def case_key(case):
+    return f"{case['render_mode']}|{case['images']}img|{case['duration']}s|{'+'.join(case['renditions'])}"
+
+def summarize(results):
+    """Median per configuration over the repeats (failed runs excluded)."""
+    grouped = {}
+    for r in results:
+        if r["ok"]: grouped.setdefault(case_key(r), []).append(r)
+    summary = {}
+    for key, runs in grouped.items():
+        summary[key] = {
+            "runs": len(runs),
+            "wall_seconds": round(statistics.median(r["wall_seconds"] for r in runs), 4),
+            "stages": {stage: round(statistics.median(r["stages"][stage] for r in runs), 4) for stage in STAGES},
+        }
+    return summary
+
+def compare(summary, baseline, max_regression, min_seconds):
+    """Configurations whose median wall / stage time grew by more than `max_regression` (a fraction)."""
+    regressions = []
+    for key, current in summary.items():
+        previous = baseline.get(key)
+        if not previous: continue
+        pairs = [("wall_seconds", previous["wall_seconds"], current["wall_seconds"])]
+        pairs += [(stage, previous["stages"].get(stage, 0), current["stages"][stage]) for stage in STAGES]
+        for metric, before, after in pairs:
+            # Sub-`min_seconds` stages are mostly noise
+            if before < min_seconds and after < min_seconds: continue
+            if before > 0 and (after - before) / before > max_regression:
+                regressions.append({"case": key, "metric": metric, "baseline": before, "current": after,
+                                    "change": round((after - before) / before, 3)})
+    return regressions
+
+def environment(utils):
+    try:
+        ffmpeg = subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.split("\n", 1)[0]
+    except OSError: ffmpeg = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg,
+        "render_cpus": utils.render_cpus(),
+        "segment_workers": utils.segment_workers(),
+    }
+
+
+def _csv(value, cast=str):
+    return [cast(v.strip()) for v in value.split(",") if v.strip()]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline per-stage benchmark of generate_video_from_images().")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="comma-separated image counts (default %(default)s)")
+    parser.add_argument("--durations", default=DEFAULT_DURATIONS, help="comma-separated target durations in seconds (default %(default)s)")
+    parser.add_argument("--renditions", default=DEFAULT_RENDITIONS, help="';'-separated rendition sets, names joined by '+' (default %(default)s)")
+    parser.add_argument("--modes", default=DEFAULT_MODES, help="comma-separated render modes (default %(default)s)")
+    parser.add_argument("--template", default="sale", help="template overlay id, 'none' to skip (default %(default)s)")
+    parser.add_argument("--source-size", default="1200x1200", help="WxH of the served product images (default %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per configuration (default %(default)s)")
+    parser.add_argument("--case-timeout", type=float, default=600, help="seconds before a run is killed and reported as failed (default %(default)s)")
+    parser.add_argument("--script-latency", type=float, default=0.0, help="seconds the stubbed Gemini call sleeps")
+    parser.add_argument("--warm", action="store_true", help="keep caches between runs instead of starting cold")
+    parser.add_argument("--cache-dir", help="CACHE_DIR to use (default: a temporary directory)")
+    parser.add_argument("--output", default="-", help="JSON results file, '-' for stdout (default %(default)s)")
+    parser.add_argument("--baseline", help="previous JSON results to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed slowdown vs baseline as a fraction (default %(default)s)")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore stages faster than this in the comparison (default %(default)s)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="bench_cache_")
+    # Must be set before config/utils are imported (they create the caches at import time)
+    os.environ["CACHE_DIR"] = cache_dir
+    import utils
+
+    w, h = (int(v) for v in args.source_size.lower().split("x"))
+    ImageHandler.source_size = (w, h)
+    cases = [
+        {"images": n, "duration": d, "renditions": rs.split("+"), "render_mode": mode}
+        for mode in _csv(args.modes) for rs in (s for s in args.renditions.split(";") if s.strip())
+        for n in _csv(args.images, int) for d in _csv(args.durations, int)
+    ]
+
+    timer = StageTimer()
+    install_stubs(utils, timer, args.script_latency)
+    server, base_url = start_image_server()
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    # Renders (and whatever a killed run leaves behind) go to the throwaway dir, not the served VIDEO_DIR
+    utils.VIDEO_DIR = os.path.join(work_dir, "video")
+    os.makedirs(utils.VIDEO_DIR)
+    results = []
+    try:
+        bgm_path = make_music_bed(os.path.join(work_dir, "bed.m4a"), max(c["duration"] for c in cases) + 5)
+        for case in cases:
+            for repeat in range(args.repeat):
+                result = run_case_isolated(utils, timer, base_url, case, args.template, bgm_path, args.warm, args.case_timeout)
+                result["repeat"] = repeat
+                results.append(result)
+                status = "ok" if result["ok"] else f"FAILED ({result['error']})"
+                print(f"⏱️ {case_key(case)} #{repeat}: {result['wall_seconds']}s {status}", file=sys.stderr)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.cache_dir: shutil.rmtree(cache_dir, ignore_errors=True)
+
+    summary = summarize(results)
+    report = {
+        "version": RESULT_VERSION,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "environment": environment(utils),
+        "settings": {"template": args.template, "case_timeout": args.case_timeout, "source_size": [w, h], "repeat": args.repeat, "warm": args.warm, "script_latency": args.script_latency},
+        "results": results,
+        "summary": summary,
+    }
+
+    exit_code = 0 if all(r["ok"] for r in results) else 1
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f).get("summary", {})
+        report["regressions"] = compare(summary, baseline, args.max_regression, args.min_seconds)
+        for r in report["regressions"]:
+            print(f"🐢 {r['case']} {r['metric']}: {r['baseline']}s -> {r['current']}s (+{r['change']:.0%})", file=sys.stderr)
+        if report["regressions"]: exit_code = 1
+
+    payload = json.dumps(report, indent=2)
+    if args.output == "-": print(payload)
+    else:
+        with open(args.output, "w") as f: f.write(payload)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
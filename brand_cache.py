@@ -0,0 +1,99 @@
+import os
+import time
+import threading
+
+from redis_client import get_redis, get_async_redis
+from config import BRAND_CACHE_TTL_SECONDS
+
+# 🎨 Brand kits change rarely but are read on every render and settings page.
+#    Each process keeps them in a small TTL cache; /api/save-brand-settings
+#    publishes the shop on INVALIDATE_CHANNEL so every API process and worker
+#    drops its copy right away (the TTL bounds staleness if Redis is down).
+INVALIDATE_CHANNEL = "brand_settings_invalidate"
+BRAND_PROJECTION = {"_id": 0}
+
+_entries = {} # shop -> (expires_at, settings or None)
+_lock = threading.Lock()
+_listener = None
+_sync_collection = None
+
+
+def _cached(shop):
+    with _lock:
+        entry = _entries.get(shop)
+        if entry and entry[0] > time.monotonic(): return True, entry[1]
+        _entries.pop(shop, None)
+    return False, None
+
+def _store(shop, settings):
+    with _lock:
+        _entries[shop] = (time.monotonic() + BRAND_CACHE_TTL_SECONDS, settings)
+
+def evict(shop):
+    with _lock:
+        _entries.pop(shop, None)
+
+
+# --- Invalidation listener ---
+def _listen():
+    while True:
+        pubsub = None
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATE_CHANNEL)
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message and message.get("type") == "message": evict(message["data"])
+        except Exception as e:
+            print(f"⚠️ Brand cache invalidation listener reconnecting: {e}")
+            # Anything could have changed while we were deaf
+            with _lock: _entries.clear()
+            time.sleep(5)
+        finally:
+            if pubsub is not None:
+                try: pubsub.close()
+                except Exception: pass
+
+def _ensure_listener():
+    global _listener
+    if _listener is not None and _listener.is_alive(): return
+    with _lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, name="brand-cache-invalidate", daemon=True)
+            _listener.start()
+
+
+# --- Worker side (sync, pooled pymongo) ---
+def _brand_collection():
+    global _sync_collection
+    if _sync_collection is None:
+        from pymongo import MongoClient
+        _sync_collection = MongoClient(os.getenv("MONGO_DETAILS"), maxPoolSize=4).video_ai_db.get_collection("brand_settings")
+    return _sync_collection
+
+def get_brand_settings(shop):
+    """Brand kit for a shop (None if the shop never saved one)."""
+    if not shop: return None
+    _ensure_listener()
+    hit, settings = _cached(shop)
+    if not hit:
+        settings = _brand_collection().find_one({"shop": shop}, BRAND_PROJECTION)
+        _store(shop, settings)
+    return dict(settings) if settings else None
+
+
+# --- API side (motor) ---
+async def get_brand_settings_async(collection, shop):
+    if not shop: return None
+    _ensure_listener()
+    hit, settings = _cached(shop)
+    if not hit:
+        settings = await collection.find_one({"shop": shop}, BRAND_PROJECTION)
+        _store(shop, settings)
+    return dict(settings) if settings else None
+
+async def invalidate_brand_settings(shop):
+    """Call after writing a shop's settings: drops this process's copy and tells the others."""
+    evict(shop)
+    try: await get_async_redis().publish(INVALIDATE_CHANNEL, shop)
+    except Exception as e: print(f"⚠️ Brand cache invalidation publish failed for {shop}: {e}")
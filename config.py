@@ -8,10 +8,30 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 VIDEO_DIR = os.path.join(BASE_DIR, "video")
 os.makedirs(VIDEO_DIR, exist_ok=True)
 
+# ⚡ Persistent media cache (survives between jobs, unlike VIDEO_DIR temp files)
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+os.makedirs(CACHE_DIR, exist_ok=True)
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "1024"))
+VOICE_CACHE_MAX_MB = int(os.getenv("VOICE_CACHE_MAX_MB", "512"))
+SEGMENT_CACHE_MAX_MB = int(os.getenv("SEGMENT_CACHE_MAX_MB", "2048"))
+# Entries validated more recently than this are served without asking the CDN
+IMAGE_CACHE_FRESH_SECONDS = int(os.getenv("IMAGE_CACHE_FRESH_SECONDS", "3600"))
+
 # 🟢 NOW IT IS DYNAMIC!
 # It tries to get the link from .env. If missing, it falls back to your hardcoded Ngrok.
 BASE_PUBLIC_URL = os.getenv("BASE_PUBLIC_URL", "https://snakiest-edward-autochthonously.ngrok-free.dev")
 
+# 🎬 Render mode: "files" (JPEG stills via -loop 1), "stream" (raw frames piped to ffmpeg)
+#    or "segments" (stills encoded in parallel, joined with stream copy)
+RENDER_MODE = os.getenv("RENDER_MODE", "files")
+
+# Redis (Celery broker + shared caches)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SCRIPT_CACHE_TTL_SECONDS = int(os.getenv("SCRIPT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+BRAND_CACHE_TTL_SECONDS = int(os.getenv("BRAND_CACHE_TTL_SECONDS", "300"))
+# Identical render requests within this window get the existing job back
+DEDUP_WINDOW_SECONDS = int(os.getenv("DEDUP_WINDOW_SECONDS", "3600"))
+
 # API Keys
 SHOPIFY_API_SECRET = os.getenv("SHOPIFY_API_SECRET")
 META_CLIENT_ID = os.getenv("META_CLIENT_ID")
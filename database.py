@@ -17,4 +17,5 @@ shop_collection = database.get_collection("shopify_stores")
 brand_collection = database.get_collection("brand_settings")
 publish_collection = database.get_collection("publish_jobs")
 review_collection = database.get_collection("user_reviews")
-
+batch_jobs_collection = database.get_collection("batch_jobs")
+product_collection = database.get_collection("shopify_products")
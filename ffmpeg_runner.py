@@ -0,0 +1,84 @@
+import time
+import threading
+import subprocess
+
+
+def _parse_out_time(fields):
+    """ffmpeg reports the position as out_time_us (newer) or out_time_ms (also µs, historical quirk)."""
+    for key in ("out_time_us", "out_time_ms"):
+        value = fields.get(key)
+        if value and value.lstrip("-").isdigit():
+            return max(0, int(value)) / 1_000_000
+    return None
+
+def _parse_speed(fields):
+    try: return float(fields.get("speed", "").rstrip("x"))
+    except ValueError: return None
+
+def run_ffmpeg(cmd, total_duration, on_progress=None, stdin_frames=None):
+    """
+    Runs an ffmpeg command with `-progress pipe:1` and parses the key=value
+    blocks on a reader thread, so the caller gets continuous progress instead
+    of one jump at the end.
+
+    on_progress(fraction, eta_seconds, speed) is called once per progress block.
+    stdin_frames (iterable of bytes) is written to ffmpeg's stdin from a writer
+    thread, for commands that read `-i pipe:0`.
+
+    Returns {"wall_seconds", "media_seconds", "speed"}; raises
+    CalledProcessError on a non-zero exit.
+    """
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if stdin_frames is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+    )
+    last = {"speed": None}
+
+    def write_frames():
+        try:
+            for chunk in stdin_frames: proc.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            pass # ffmpeg exited early; its return code tells the story
+        finally:
+            try: proc.stdin.close()
+            except OSError: pass
+
+    def read_progress():
+        fields = {}
+        for raw in proc.stdout:
+            line = raw.decode("utf-8", "replace").strip()
+            if "=" not in line: continue
+            key, value = line.split("=", 1)
+            fields[key] = value
+            if key != "progress": continue
+
+            # End of one progress block
+            position = _parse_out_time(fields)
+            speed = _parse_speed(fields)
+            if speed: last["speed"] = speed
+            if position is not None and total_duration and on_progress:
+                fraction = min(1.0, position / total_duration)
+                elapsed = time.monotonic() - started
+                eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+                try: on_progress(fraction, eta, speed)
+                except Exception as e: print(f"⚠️ Progress callback failed: {e}")
+            fields = {}
+
+    threads = [threading.Thread(target=read_progress, name="ffmpeg-progress", daemon=True)]
+    if stdin_frames is not None:
+        threads.append(threading.Thread(target=write_frames, name="ffmpeg-stdin", daemon=True))
+    for t in threads: t.start()
+
+    returncode = proc.wait()
+    for t in threads: t.join(timeout=5)
+    if returncode != 0: raise subprocess.CalledProcessError(returncode, cmd)
+
+    wall = time.monotonic() - started
+    return {
+        "wall_seconds": round(wall, 3),
+        "media_seconds": round(float(total_duration or 0), 3),
+        "speed": round(float(total_duration) / wall, 3) if wall > 0 and total_duration else last["speed"],
+    }
@@ -0,0 +1,51 @@
+import os
+import logging
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# 🗂️ Every index the hot queries rely on, declared once and ensured at
+#    startup by both the API (motor) and the worker (pymongo).
+#    create_index is a no-op when the index already exists.
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "30"))
+RETENTION_SECONDS = JOB_RETENTION_DAYS * 24 * 3600
+
+# (collection, keys, options)
+INDEX_SPECS = [
+    # Legacy job docs may lack job_id, so uniqueness only covers docs that have one
+    ("video_jobs", [("job_id", ASCENDING)], {"unique": True, "partialFilterExpression": {"job_id": {"$exists": True}}}),
+    ("video_jobs", [("batch_id", ASCENDING), ("batch_index", ASCENDING)], {"sparse": True}),
+    ("video_jobs", [("fingerprint", ASCENDING), ("created_at", DESCENDING)], {"sparse": True}),
+    ("video_jobs", [("created_at", ASCENDING)], {"expireAfterSeconds": RETENTION_SECONDS}),
+    ("publish_jobs", [("created_at", ASCENDING)], {"expireAfterSeconds": RETENTION_SECONDS}),
+    ("batch_jobs", [("batch_id", ASCENDING)], {"unique": True}),
+    ("batch_jobs", [("created_at", ASCENDING)], {"expireAfterSeconds": RETENTION_SECONDS}),
+    ("brand_settings", [("shop", ASCENDING)], {"unique": True}),
+    ("shopify_stores", [("shop", ASCENDING)], {"unique": True}),
+    ("social_accounts", [("platform", ASCENDING), ("platform_user_id", ASCENDING)], {}),
+    ("user_reviews", [("is_approved", ASCENDING)], {}),
+    # Product catalog mirror (see product_catalog.py)
+    ("shopify_products", [("shop", ASCENDING), ("product_id", ASCENDING)], {"unique": True}),
+    ("shopify_products", [("shop", ASCENDING), ("title_sort", ASCENDING)], {}),
+    ("shopify_products", [("shop", ASCENDING), ("updated_at", DESCENDING)], {}),
+    ("shopify_products", [("shop", ASCENDING), ("title", TEXT), ("vendor", TEXT), ("tags", TEXT)],
+     {"weights": {"title": 10, "vendor": 3, "tags": 2}, "name": "product_text_search"}),
+]
+
+
+def _log_failure(collection, keys, error):
+    # e.g. duplicates blocking a unique index, or a TTL that changed: log and keep serving
+    logger.error(f"❌ Index {collection}{keys} not created: {error}")
+
+async def ensure_indexes(database):
+    """API startup (motor database)."""
+    for collection, keys, options in INDEX_SPECS:
+        try: await database.get_collection(collection).create_index(keys, **options)
+        except OperationFailure as e: _log_failure(collection, keys, e)
+
+def ensure_indexes_sync(db):
+    """Worker startup (pymongo database)."""
+    for collection, keys, options in INDEX_SPECS:
+        try: db.get_collection(collection).create_index(keys, **options)
+        except OperationFailure as e: _log_failure(collection, keys, e)
@@ -0,0 +1,88 @@
+import json
+import asyncio
+import logging
+
+from redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# 📡 Job status fan-out.
+# Workers PUBLISH every persisted status change on `job_status:<job_id>`;
+# each API process holds ONE pattern subscription and fans messages out to
+# every SSE listener in memory.
+CHANNEL_PREFIX = "job_status:"
+STATUS_FIELDS = ("status", "progress", "url", "error", "stage", "eta_seconds", "renditions", "variants")
+TERMINAL_STATUSES = ("done", "failed", "not_found")
+
+
+def status_payload(job_id, fields):
+    payload = {k: fields[k] for k in STATUS_FIELDS if k in fields}
+    payload["job_id"] = job_id
+    return payload
+
+# --- Worker side (sync) ---
+def publish_job_status(job_id, fields):
+    """Called after a status write hits Mongo. Best effort: polling still works without it."""
+    try:
+        get_redis().publish(f"{CHANNEL_PREFIX}{job_id}", json.dumps(status_payload(job_id, fields), default=str))
+    except Exception as e:
+        print(f"⚠️ Status publish failed for {job_id}: {e}")
+
+
+# --- API side (asyncio) ---
+class JobStatusHub:
+    """One upstream Redis subscription per process, many in-memory listeners."""
+
+    def __init__(self):
+        self._listeners = {} # job_id -> set of asyncio.Queue
+        self._task = None
+        self.available = True
+
+    def subscribe(self, job_ids):
+        queue = asyncio.Queue(maxsize=100)
+        for job_id in job_ids:
+            self._listeners.setdefault(job_id, set()).add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._pump())
+        return queue
+
+    def unsubscribe(self, job_ids, queue):
+        for job_id in job_ids:
+            listeners = self._listeners.get(job_id)
+            if not listeners: continue
+            listeners.discard(queue)
+            if not listeners: self._listeners.pop(job_id, None)
+
+    async def _pump(self):
+        pubsub = get_async_redis().pubsub()
+        try:
+            await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+            self.available = True
+            async for message in pubsub.listen():
+                if message.get("type") != "pmessage": continue
+                job_id = message["channel"][len(CHANNEL_PREFIX):]
+                listeners = self._listeners.get(job_id)
+                if not listeners: continue
+                try: payload = json.loads(message["data"])
+                except ValueError: continue
+                for queue in list(listeners):
+                    if queue.full():
+                        try: queue.get_nowait() # slow consumer: keep only the freshest updates
+                        except asyncio.QueueEmpty: pass
+                    queue.put_nowait(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Listeners notice via `available` and fall back to polling Mongo
+            self.available = False
+            logger.error(f"❌ Job status subscription lost: {e}")
+        finally:
+            try: await (getattr(pubsub, "aclose", None) or pubsub.close)()
+            except Exception: pass
+
+    async def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+
+job_status_hub = JobStatusHub()
@@ -8,6 +8,10 @@ from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 # Import Config and Routes
 from config import VIDEO_DIR, BASE_PUBLIC_URL
 from routes import video, auth, publish, general
+from job_events import job_status_hub
+from shopify_client import close_clients
+from database import database
+from indexes import ensure_indexes
 
 app = FastAPI()
 
@@ -41,6 +45,16 @@ app.include_router(auth.router)
 app.include_router(publish.router)
 app.include_router(general.router)
 
+# --- Lifecycle ---
+@app.on_event("startup")
+async def startup():
+    await ensure_indexes(database)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_status_hub.close()
+    await close_clients()
+
 # --- Root Endpoint ---
 @app.get("/")
 def home(): 
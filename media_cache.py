@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import functools
+import threading
+
+from config import CACHE_DIR, IMAGE_CACHE_MAX_MB, VOICE_CACHE_MAX_MB, SEGMENT_CACHE_MAX_MB
+
+
+def cache_key(*parts):
+    """Stable hex key for any mix of strings/numbers (URL, size, version...)."""
+    raw = "|".join(str(p) for p in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+@functools.lru_cache(maxsize=1024)
+def _digest(path, size, mtime_ns):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""): h.update(chunk)
+    return h.hexdigest()
+
+def file_digest(path):
+    """sha256 of a file's bytes (memoized per path/size/mtime, so re-hashing an unchanged file is free)."""
+    st = os.stat(path)
+    return _digest(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+class DiskLRUCache:
+    """
+    Size-bounded on-disk cache shared by every worker process on the box.
+
+    Each entry is a data file `<key><ext>` plus a `<key>.json` sidecar holding
+    its metadata. The data file's mtime is the LRU clock (bumped on every hit),
+    so no shared index has to be kept in sync between processes.
+
+    Each process keeps its own LRU index and byte total in memory (loaded from
+    disk once, then updated on store / hit / evict), so a store costs O(1)
+    unless the cache is over its limit. The index is rebuilt from disk every
+    `rescan_interval` seconds to pick up what other processes stored.
+    """
+
+    def __init__(self, name, max_bytes, min_age=300, rescan_interval=300):
+        self.name = name
+        self.root = os.path.join(CACHE_DIR, name)
+        os.makedirs(self.root, exist_ok=True)
+        self.max_bytes = max_bytes
+        # Entries touched more recently than this are never evicted (a render may be reading them)
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._index = None # key -> (mtime, size, file name), loaded on the first store
+        self._bytes = 0
+        self._scanned_at = 0.0
+
+    # --- Paths ---
+    def _meta_path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def owns(self, path):
+        """True if `path` lives inside this cache (callers must not delete it)."""
+        if not path: return False
+        return os.path.abspath(path).startswith(os.path.abspath(self.root) + os.sep)
+
+    # --- Counters ---
+    def record_hit(self):
+        with self._lock: self.hits += 1
+
+    def record_miss(self):
+        with self._lock: self.misses += 1
+
+    # --- Read ---
+    def get(self, key, count=True):
+        """Returns (path, meta) for a live entry or (None, None). Bumps recency on hit."""
+        try:
+            with open(self._meta_path(key)) as f: meta = json.load(f)
+            path = os.path.join(self.root, meta["file"])
+            if not os.path.exists(path): raise FileNotFoundError(path)
+            os.utime(path, None)
+        except Exception:
+            if count: self.record_miss()
+            return None, None
+        if count: self.record_hit()
+        self._track(key, meta["file"], meta.get("size") or 0, time.time())
+        return path, meta
+
+    def touch(self, key, **meta_updates):
+        """Bumps recency and merges `meta_updates` into the sidecar."""
+        path, meta = self.get(key, count=False)
+        if not path: return None
+        if meta_updates:
+            meta.update(meta_updates)
+            self._write_meta(key, meta)
+        return path
+
+    # --- Write ---
+    def reserve(self, ext):
+        """Temp path inside the cache dir; fill it, then hand it to `commit()`."""
+        return os.path.join(self.root, f"tmp_{uuid.uuid4().hex[:12]}{ext}")
+
+    def commit(self, key, tmp_path, ext, meta=None):
+        """Atomically publishes a file written to a `reserve()` path under `key`."""
+        final_name = f"{key}{ext}"
+        final_path = os.path.join(self.root, final_name)
+        os.replace(tmp_path, final_path)
+        entry = dict(meta or {})
+        entry.update({"file": final_name, "size": os.path.getsize(final_path), "stored_at": time.time()})
+        self._write_meta(key, entry)
+        with self._lock: self.stores += 1
+        self._track(key, final_name, entry["size"], time.time())
+        self._evict()
+        return final_path
+
+    def _write_meta(self, key, meta):
+        tmp = self._meta_path(key) + f".{uuid.uuid4().hex[:6]}.tmp"
+        with open(tmp, "w") as f: json.dump(meta, f)
+        os.replace(tmp, self._meta_path(key))
+
+    # --- Eviction ---
+    def _entries(self):
+        """Full scan of the sidecars (index rebuilds only)."""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"): continue
+            key = name[:-5]
+            try:
+                with open(os.path.join(self.root, name)) as f: meta = json.load(f)
+                st = os.stat(os.path.join(self.root, meta["file"]))
+                entries.append((st.st_mtime, st.st_size, key, meta["file"]))
+            except Exception:
+                continue
+        return entries
+
+    def _load_index(self):
+        """Caller holds the lock. Rebuilds the index if it is missing or older than rescan_interval."""
+        if self._index is not None and time.monotonic() - self._scanned_at < self.rescan_interval: return
+        self._index = {key: (mtime, size, file_name) for mtime, size, key, file_name in self._entries()}
+        self._bytes = sum(size for _, size, _ in self._index.values())
+        self._scanned_at = time.monotonic()
+
+    def _track(self, key, file_name, size, mtime):
+        with self._lock:
+            if self._index is None: return # not loaded yet: the first scan will see it
+            previous = self._index.get(key)
+            if previous: self._bytes -= previous[1]
+            self._index[key] = (mtime, size, file_name)
+            self._bytes += size
+
+    def _drop(self, key):
+        """Caller holds the lock."""
+        entry = self._index.pop(key, None)
+        if entry: self._bytes -= entry[1]
+
+    def _evict(self):
+        with self._lock:
+            self._load_index()
+            if self._bytes <= self.max_bytes: return
+            now = time.time()
+            for mtime, key in sorted((entry[0], key) for key, entry in self._index.items()):
+                if self._bytes <= self.max_bytes: break
+                if now - mtime < self.min_age: break # oldest first: everything after is younger
+                _, size, file_name = self._index[key]
+                path = os.path.join(self.root, file_name)
+                # Another process may have used it (newer mtime) or evicted it already
+                try: disk_mtime = os.stat(path).st_mtime
+                except OSError:
+                    self._drop(key)
+                    continue
+                if disk_mtime > mtime:
+                    self._index[key] = (disk_mtime, size, file_name)
+                    if now - disk_mtime < self.min_age: continue
+                for p in (path, self._meta_path(key)):
+                    try: os.remove(p)
+                    except OSError: pass
+                self._drop(key)
+                self.evictions += 1
+
+
+# ⚡ Letterboxed product images + thumbnailed logos, keyed by (URL, resolution)
+image_cache = DiskLRUCache("images", max_bytes=IMAGE_CACHE_MAX_MB * 1024 * 1024)
+
+# ⚡ Synthesized voiceovers keyed by (script hash, gender, rate); meta carries the measured duration
+voice_cache = DiskLRUCache("voiceovers", max_bytes=VOICE_CACHE_MAX_MB * 1024 * 1024)
+
+# ⚡ Encoded still segments (render_mode "segments") keyed by (image bytes, frames, size, overlay, logo, encoder)
+segment_cache = DiskLRUCache("segments", max_bytes=SEGMENT_CACHE_MAX_MB * 1024 * 1024)
@@ -18,4 +18,38 @@ class ReviewRequest(BaseModel):
     name: str
     rating: int
     comment: str
-    designation: Optional[str] = "Store Owner"
\ No newline at end of file
+    designation: Optional[str] = "Store Owner"
+
+class BatchProduct(BaseModel):
+    image_urls: List[str]
+    product_title: str
+    product_desc: str = ""
+    logo_url: Optional[str] = None
+
+class BatchRenderRequest(BaseModel):
+    shop_name: str
+    products: List[BatchProduct]
+    voice_gender: str = "female"
+    duration: int = 15
+    script_tone: str = "Professional"
+    video_theme: str = "Modern"
+    template_id: str = "none"
+    renditions: List[str] = []
+    regenerate: bool = False
+
+class VariantSpec(BaseModel):
+    voice_gender: str = "female"
+    script_tone: str = "Professional"
+    video_theme: str = "Modern"
+
+class VariantRenderRequest(BaseModel):
+    shop_name: str
+    image_urls: List[str]
+    product_title: str
+    product_desc: str = ""
+    logo_url: Optional[str] = None
+    variants: List[VariantSpec]
+    duration: int = 15
+    template_id: str = "none"
+    renditions: List[str] = []
+    regenerate: bool = False
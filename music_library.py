@@ -0,0 +1,182 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import threading
+import subprocess
+import requests
+
+from config import CACHE_DIR
+from media_cache import cache_key
+
+# 🎵 Local background-music library.
+# Tracks are downloaded ONCE (worker start-up or `python music_library.py`), stored
+# pre-transcoded to the mixer's format and measured, so renders never touch the network.
+MUSIC_DIR = os.path.join(CACHE_DIR, "music")
+MANIFEST_PATH = os.path.join(MUSIC_DIR, "library.json")
+os.makedirs(MUSIC_DIR, exist_ok=True)
+
+# Mixer format (the final ffmpeg pass encodes AAC at this rate too)
+MIX_SAMPLE_RATE = 44100
+MIX_CHANNELS = 2
+MIX_BITRATE = "128k"
+# Loudness the old hard-coded volumes were tuned for (bensound-elevate is mastered around here)
+REFERENCE_LUFS = -14.0
+
+_BENSOUND = "https://www.bensound.com/bensound-music/bensound-{}.mp3"
+MUSIC_THEMES = {
+    "modern": [_BENSOUND.format("elevate"), _BENSOUND.format("creativeminds")],
+    "energetic": [_BENSOUND.format("energy"), _BENSOUND.format("happyrock")],
+    "luxury": [_BENSOUND.format("romantic"), _BENSOUND.format("slowmotion")],
+    "playful": [_BENSOUND.format("ukulele"), _BENSOUND.format("sunny")],
+    "calm": [_BENSOUND.format("acousticbreeze"), _BENSOUND.format("slowmotion")],
+}
+DEFAULT_THEME = "modern"
+# Frontend theme names that map onto the same mood
+THEME_ALIASES = {"minimal": "modern", "bold": "energetic", "sport": "energetic", "elegant": "luxury",
+                 "premium": "luxury", "fun": "playful", "kids": "playful", "relaxed": "calm", "nature": "calm"}
+
+_manifest = None
+_manifest_mtime = 0
+_sync_lock = threading.Lock()
+
+
+# --- Manifest ---
+def _load_manifest():
+    """Manifest is re-read only when another process has rewritten it."""
+    global _manifest, _manifest_mtime
+    try:
+        mtime = os.path.getmtime(MANIFEST_PATH)
+    except OSError:
+        return {}
+    if _manifest is None or mtime != _manifest_mtime:
+        try:
+            with open(MANIFEST_PATH) as f: _manifest = json.load(f)
+            _manifest_mtime = mtime
+        except Exception:
+            return _manifest or {}
+    return _manifest
+
+def _save_manifest(manifest):
+    tmp = f"{MANIFEST_PATH}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp, "w") as f: json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+# --- Ingest (runs off the hot path) ---
+def _probe_duration(path):
+    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return float(result.stdout.strip())
+
+def _measure_loudness(path):
+    """Integrated loudness (LUFS) from ffmpeg's ebur128 summary."""
+    cmd = ['ffmpeg', '-hide_banner', '-nostats', '-i', path, '-af', 'ebur128', '-f', 'null', '-']
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    found = re.findall(r"I:\s+(-?\d+(?:\.\d+)?) LUFS", result.stderr)
+    return float(found[-1]) if found else REFERENCE_LUFS
+
+def _ingest_track(url):
+    res = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=60)
+    res.raise_for_status()
+    if "text/html" in res.headers.get("Content-Type", ""):
+        raise ValueError(f"URL returned HTML instead of audio: {url}")
+
+    track_id = cache_key("music", url)[:16]
+    raw_path = os.path.join(MUSIC_DIR, f"src_{uuid.uuid4().hex[:8]}.mp3")
+    out_name = f"{track_id}.m4a"
+    tmp_out = os.path.join(MUSIC_DIR, f"tmp_{uuid.uuid4().hex[:8]}.m4a")
+    try:
+        with open(raw_path, "wb") as f: f.write(res.content)
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-i', raw_path, '-vn',
+            '-c:a', 'aac', '-b:a', MIX_BITRATE, '-ar', str(MIX_SAMPLE_RATE), '-ac', str(MIX_CHANNELS),
+            tmp_out
+        ], check=True)
+        os.replace(tmp_out, os.path.join(MUSIC_DIR, out_name))
+    finally:
+        for p in (raw_path, tmp_out):
+            if os.path.exists(p): os.remove(p)
+
+    out_path = os.path.join(MUSIC_DIR, out_name)
+    return track_id, {
+        "source": url,
+        "file": out_name,
+        "duration": _probe_duration(out_path),
+        "lufs": _measure_loudness(out_path),
+        "sample_rate": MIX_SAMPLE_RATE,
+        "ingested_at": time.time(),
+    }
+
+def sync_music_library(force=False):
+    """Downloads + transcodes any library track that is not on disk yet. Safe to call repeatedly."""
+    with _sync_lock:
+        manifest = dict(_load_manifest())
+        tracks = manifest.get("tracks", {})
+        themes = {}
+        for theme, urls in MUSIC_THEMES.items():
+            themes[theme] = []
+            for url in urls:
+                track_id = cache_key("music", url)[:16]
+                entry = tracks.get(track_id)
+                if force or not entry or not os.path.exists(os.path.join(MUSIC_DIR, entry["file"])):
+                    try:
+                        print(f"🎵 Ingesting library track: {url}")
+                        track_id, entry = _ingest_track(url)
+                        tracks[track_id] = entry
+                    except Exception as e:
+                        print(f"⚠️ Music library: could not ingest {url}: {e}")
+                        continue
+                themes[theme].append(track_id)
+        manifest = {"tracks": tracks, "themes": themes, "synced_at": time.time()}
+        _save_manifest(manifest)
+        print(f"🎵 Music library ready: {len(tracks)} tracks")
+        return manifest
+
+def sync_music_library_async():
+    threading.Thread(target=sync_music_library, name="music-library-sync", daemon=True).start()
+
+
+# --- Hot path (zero network I/O) ---
+def normalize_theme(video_theme):
+    theme = str(video_theme or "").strip().lower()
+    theme = THEME_ALIASES.get(theme, theme)
+    return theme if theme in MUSIC_THEMES else DEFAULT_THEME
+
+def select_track(video_theme, seed=""):
+    """
+    Picks a local track for the theme (stable for the same `seed`, e.g. the product title).
+    Returns {"path", "duration", "lufs", "gain"} or None if the library is not synced yet.
+    """
+    manifest = _load_manifest()
+    tracks = manifest.get("tracks", {})
+    themes = manifest.get("themes", {})
+    candidates = [t for t in themes.get(normalize_theme(video_theme), []) if t in tracks]
+    if not candidates:
+        candidates = [t for t in themes.get(DEFAULT_THEME, []) if t in tracks] or list(tracks)
+    if not candidates: return None
+
+    track_id = candidates[int(cache_key(seed), 16) % len(candidates)]
+    entry = tracks[track_id]
+    path = os.path.join(MUSIC_DIR, entry["file"])
+    if not os.path.exists(path): return None
+    return {
+        "id": track_id,
+        "path": path,
+        "duration": entry.get("duration"),
+        "lufs": entry.get("lufs"),
+        "gain": loudness_gain(entry.get("lufs")),
+    }
+
+def loudness_gain(lufs):
+    """Linear gain that brings a track to REFERENCE_LUFS (clamped so bad measurements stay sane)."""
+    if lufs is None: return 1.0
+    gain = 10 ** ((REFERENCE_LUFS - float(lufs)) / 20)
+    return max(0.25, min(4.0, gain))
+
+
+if __name__ == "__main__":
+    # 👇 Pre-populate the library (e.g. at deploy time) so the first jobs already have music
+    sync_music_library(force="--force" in sys.argv)
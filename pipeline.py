@@ -0,0 +1,254 @@
+import os
+import json
+import uuid
+import shutil
+from datetime import datetime
+from celery import Task, chain, chord, group
+
+from tasks import celery_app, video_jobs_collection, generate_viral_caption
+from utils import (
+    VIDEO_DIR, resolve_renditions, master_size, rendition_filename, resolve_brand, resolve_music,
+    fetch_images, generate_script, synthesize_voiceover, create_outro_image, plan_timing, encode_video, encode_video_segments,
+)
+from progress import ProgressReporter
+from job_events import publish_job_status
+from render_dedup import settle_fingerprint, release_fingerprint
+from config import BASE_PUBLIC_URL, RENDER_MODE
+
+# 🧱 Staged render DAG:
+#       (fetch || script -> voice) -> compose -> encode -> caption
+# Every stage is its own Celery task on the queue that suits it (see
+# task_routes in tasks.py). A stage writes its output to
+# VIDEO_DIR/jobs/<job_id>/<stage>.json (VIDEO_DIR is already shared by the API
+# and the workers) and returns early when that output exists, so a retry only
+# re-runs the stage that failed. Stills have to be on disk to cross workers,
+# so encode runs in "files" mode (or "segments" when RENDER_MODE asks for it).
+JOBS_DIR = os.path.join(VIDEO_DIR, "jobs")
+# Stages of one job run in parallel: once any of them has failed the job, the others must not flip it back
+NOT_FAILED = {"status": {"$ne": "failed"}}
+STAGE_RETRY = {"autoretry_for": (Exception,), "retry_backoff": True, "retry_backoff_max": 120, "max_retries": 3}
+
+
+class PermanentStageError(Exception):
+    """Retrying cannot help (e.g. none of the images could be downloaded)."""
+
+
+# --- Artifacts ---
+def job_dir(job_id, create=False):
+    """
+    Only start_render_pipeline() creates the folder. A stage finding it gone
+    means the job already failed (RenderStage.on_failure removed it), and
+    re-creating it would leave orphaned artifacts under VIDEO_DIR.
+    """
+    path = os.path.join(JOBS_DIR, job_id)
+    if create: os.makedirs(path, exist_ok=True)
+    elif not os.path.isdir(path): raise PermanentStageError("Job folder is gone (job already failed)")
+    return path
+
+def load_artifact(job_id, stage):
+    path = os.path.join(JOBS_DIR, job_id, f"{stage}.json")
+    if not os.path.exists(path): return None
+    with open(path) as f: return json.load(f)
+
+def save_artifact(job_id, stage, data, mirror=True):
+    """Atomic write to the job folder; also mirrored onto the job document for inspection."""
+    path = os.path.join(job_dir(job_id), f"{stage}.json")
+    tmp_path = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp_path, "w") as f: json.dump(data, f)
+    os.replace(tmp_path, path)
+    if mirror: video_jobs_collection.update_one({"job_id": job_id}, {"$set": {f"artifacts.{stage}": data}})
+    return data
+
+def _persist(job_id, src, name):
+    """Copies a cache-owned file into the job folder so eviction cannot pull it from under later stages."""
+    dest = os.path.join(job_dir(job_id), name)
+    if not os.path.exists(dest): shutil.copyfile(src, dest)
+    return dest
+
+def _files_exist(*paths):
+    return all(p is None or os.path.exists(p) for p in paths)
+
+def set_stage(job_id, stage, progress):
+    # $max: fetch and script/voice run side by side, the bar must not jump back
+    fields = {"status": "processing", "stage": stage, "updated_at": datetime.utcnow()}
+    result = video_jobs_collection.update_one({"job_id": job_id, **NOT_FAILED}, {"$set": fields, "$max": {"progress": progress}})
+    # Another stage already failed the job (and removed its folder): stop instead of recreating it
+    if not result.matched_count: raise PermanentStageError("Job already failed")
+    publish_job_status(job_id, {**fields, "progress": progress})
+
+
+class RenderStage(Task):
+    """Marks the job failed once a stage has used up its retries, and drops its intermediates."""
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        job_id = args[0] if args else kwargs.get("job_id")
+        print(f"❌ {self.name} failed for {job_id}: {exc}")
+        # The first stage to fail owns the error; a parallel stage stopping afterwards only cleans up
+        fields = {"status": "failed", "error": str(exc) or self.name, "failed_stage": self.name, "updated_at": datetime.utcnow()}
+        result = video_jobs_collection.update_one({"job_id": job_id, **NOT_FAILED}, {"$set": fields})
+        if result.matched_count: publish_job_status(job_id, fields)
+
+        request = load_artifact(job_id, "request") or {}
+        release_fingerprint(request.get("fingerprint"), job_id)
+        custom_music_path = request.get("custom_music_path")
+        if custom_music_path and os.path.exists(custom_music_path): os.remove(custom_music_path)
+        # VIDEO_DIR is served at /static: a failed job must not leave its stills and voiceover there
+        shutil.rmtree(os.path.join(JOBS_DIR, job_id), ignore_errors=True)
+
+def _stage(name):
+    return celery_app.task(name=name, base=RenderStage, bind=True, dont_autoretry_for=(PermanentStageError,), **STAGE_RETRY)
+
+
+# --- Stages ---
+@_stage("render_fetch_stage")
+def fetch_stage(self, job_id):
+    done = load_artifact(job_id, "fetch")
+    if done and _files_exist(*done["images"], done["logo"]): return
+    request = load_artifact(job_id, "request")
+    set_stage(job_id, "fetch", 5)
+
+    brand = resolve_brand(request["shop_name"], logo_url=request["logo_url"])
+    size = master_size(resolve_renditions(request["renditions"]))
+    images, logo_file = fetch_images(request["image_urls"], brand["logo_url"], size)
+    if not images: raise PermanentStageError("No Images")
+
+    save_artifact(job_id, "fetch", {
+        "images": [_persist(job_id, path, f"image_{i:03d}.jpg") for i, path in images],
+        "logo": _persist(job_id, logo_file, "logo.png") if logo_file else None,
+        "brand": brand,
+    })
+
+@_stage("render_script_stage")
+def script_stage(self, job_id):
+    if load_artifact(job_id, "script") is not None: return
+    request = load_artifact(job_id, "request")
+    set_stage(job_id, "script", 10)
+    try:
+        script = generate_script(request["product_title"], request["product_desc"], request["script_tone"], request["duration"], regenerate=request["regenerate"])
+    except Exception as e:
+        if self.request.retries < self.max_retries: raise
+        # Same degradation as the in-process render: no script -> music-only video
+        print(f"❌ Script failed for {job_id}, continuing without voiceover: {e}")
+        script = ""
+    save_artifact(job_id, "script", {"script": script})
+
+@_stage("render_voice_stage")
+def voice_stage(self, job_id):
+    done = load_artifact(job_id, "voice")
+    if done and _files_exist(done["voiceover"]): return
+    request = load_artifact(job_id, "request")
+    script = load_artifact(job_id, "script")["script"]
+    set_stage(job_id, "voice", 20)
+
+    vo_path, vo_duration = None, 0
+    if script:
+        try:
+            vo_path, vo_duration = synthesize_voiceover(script, request["voice_gender"])
+            if not vo_path: raise RuntimeError("TTS produced no audio")
+        except Exception as e:
+            if self.request.retries < self.max_retries: raise
+            print(f"❌ Voiceover failed for {job_id}, continuing without it: {e}")
+            vo_path, vo_duration = None, 0
+    save_artifact(job_id, "voice", {
+        "voiceover": _persist(job_id, vo_path, "voiceover.mp3") if vo_path else None,
+        "duration": vo_duration,
+    })
+
+@_stage("render_compose_stage")
+def compose_stage(self, job_id):
+    done = load_artifact(job_id, "compose")
+    if done and _files_exist(*done["stills"]): return
+    request = load_artifact(job_id, "request")
+    fetch, voice = load_artifact(job_id, "fetch"), load_artifact(job_id, "voice")
+    set_stage(job_id, "compose", 40)
+
+    width, height = master_size(resolve_renditions(request["renditions"]))
+    brand = fetch["brand"]
+    stills = list(fetch["images"])
+    outro_path = os.path.join(job_dir(job_id), "outro.jpg")
+    if create_outro_image(stills[-1], request["product_title"], outro_path, cta_text=brand["cta_text"], brand_color=brand["brand_color"], width=width, height=height):
+        stills.append(outro_path)
+
+    bgm_file, bgm_gain = resolve_music(request["video_theme"], request["product_title"], request["custom_music_path"])
+    final_dur, img_dur = plan_timing(request["duration"], voice["duration"] if voice["voiceover"] else 0, len(stills))
+    save_artifact(job_id, "compose", {
+        "stills": stills,
+        "bgm_file": bgm_file,
+        "bgm_gain": bgm_gain,
+        "final_duration": final_dur,
+        "image_duration": img_dur,
+        "output_name": f"vid_{uuid.uuid4().hex[:6]}.mp4",
+    })
+
+@_stage("render_encode_stage")
+def encode_stage(self, job_id):
+    done = load_artifact(job_id, "encode")
+    if done and os.path.exists(os.path.join(VIDEO_DIR, done["filename"])): return
+    request = load_artifact(job_id, "request")
+    fetch, voice, compose = load_artifact(job_id, "fetch"), load_artifact(job_id, "voice"), load_artifact(job_id, "compose")
+
+    # finish("processing") is not terminal here: it flushes and stops the progress thread
+    # (a failure is recorded by RenderStage.on_failure once retries run out)
+    reporter = ProgressReporter(video_jobs_collection, job_id, on_flush=publish_job_status, guard=NOT_FAILED)
+    try:
+        encode = encode_video_segments if RENDER_MODE == "segments" else encode_video
+        encode_stats = encode(
+            compose["stills"], compose["output_name"], compose["final_duration"], compose["image_duration"],
+            resolve_renditions(request["renditions"]), template_id=request["template_id"], logo_file=fetch["logo"],
+            vo_file=voice["voiceover"], bgm_file=compose["bgm_file"], bgm_gain=compose["bgm_gain"],
+            progress_callback=reporter,
+        )
+    except Exception:
+        reporter.finish("processing", stage="encode")
+        raise
+    reporter.finish("processing", stage="encoded", progress=95, encode_stats=encode_stats)
+    save_artifact(job_id, "encode", {"filename": compose["output_name"], "encode_stats": encode_stats})
+
+@_stage("render_caption_stage")
+def caption_stage(self, job_id):
+    request = load_artifact(job_id, "request")
+    filename = load_artifact(job_id, "encode")["filename"]
+    set_stage(job_id, "caption", 98)
+
+    smart_caption = generate_viral_caption(request["product_title"], request["product_desc"])
+    fields = {
+        "status": "done",
+        "stage": "done",
+        "progress": 100,
+        "url": f"{BASE_PUBLIC_URL}/static/{filename}",
+        "filename": filename,
+        "renditions": {
+            name: f"{BASE_PUBLIC_URL}/static/{rendition_filename(filename, name, k)}"
+            for k, name in enumerate(resolve_renditions(request["renditions"]))
+        },
+        "caption": smart_caption,
+        "completed_at": datetime.utcnow(),
+    }
+    video_jobs_collection.update_one({"job_id": job_id}, {"$set": fields})
+    publish_job_status(job_id, fields)
+    print(f"✅ Pipeline Finished: {filename}")
+    settle_fingerprint(request.get("fingerprint"), job_id)
+
+    # Intermediates are only needed while the job can still be retried
+    custom_music_path = request.get("custom_music_path")
+    if custom_music_path and os.path.exists(custom_music_path): os.remove(custom_music_path)
+    shutil.rmtree(os.path.join(JOBS_DIR, job_id), ignore_errors=True)
+
+
+# --- Entry point (API side) ---
+def start_render_pipeline(job_id, image_urls, product_title, product_desc, logo_url=None, voice_gender="female", duration=15,
+                          script_tone="Professional", custom_music_path=None, video_theme="Modern", shop_name=None,
+                          regenerate=False, template_id="none", renditions=None, fingerprint=None):
+    job_dir(job_id, create=True)
+    save_artifact(job_id, "request", {
+        "image_urls": image_urls, "product_title": product_title, "product_desc": product_desc, "logo_url": logo_url,
+        "voice_gender": voice_gender, "duration": duration, "script_tone": script_tone,
+        "custom_music_path": custom_music_path, "video_theme": video_theme, "shop_name": shop_name,
+        "regenerate": regenerate, "template_id": template_id, "renditions": renditions, "fingerprint": fingerprint,
+    }, mirror=False)
+    canvas = chain(
+        chord(group(fetch_stage.si(job_id), chain(script_stage.si(job_id), voice_stage.si(job_id))), compose_stage.si(job_id)),
+        encode_stage.si(job_id),
+        caption_stage.si(job_id),
+    )
+    return canvas.apply_async()
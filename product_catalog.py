@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne, ASCENDING
+from database import product_collection, shop_collection
+from shopify_client import iter_product_pages, shopify_post
+from config import BASE_PUBLIC_URL
+
+logger = logging.getLogger(__name__)
+
+# 🗂️ Per-shop product mirror: /api/products reads this instead of calling Shopify.
+#    Kept fresh by incremental `updated_at_min` syncs plus product webhooks.
+PRODUCT_SYNC_INTERVAL = timedelta(minutes=10)
+FULL_SYNC_INTERVAL = timedelta(hours=24) # also sweeps products deleted while webhooks were down
+SYNC_OVERLAP = timedelta(minutes=2) # re-read a little history so clock skew never drops an edit
+WEBHOOK_TOPICS = ("products/create", "products/update", "products/delete")
+
+_sync_locks = {}
+_background_syncs = set()
+
+
+def _product_doc(shop, product, sync_id=None):
+    tags = product.get("tags") or ""
+    doc = {
+        "shop": shop,
+        "product_id": product.get("id"),
+        "title": product.get("title", ""),
+        "title_sort": (product.get("title") or "").lower(),
+        "vendor": product.get("vendor", ""),
+        "tags": [t.strip() for t in tags.split(",") if t.strip()] if isinstance(tags, str) else tags,
+        "product_type": product.get("product_type", ""),
+        "updated_at": product.get("updated_at"),
+        "data": product, # exact Shopify payload, which is what the frontend already renders
+        "synced_at": datetime.utcnow(),
+    }
+    if sync_id: doc["sync_id"] = sync_id
+    return doc
+
+async def upsert_products(shop, products, sync_id=None):
+    if not products: return 0
+    ops = [
+        UpdateOne({"shop": shop, "product_id": p.get("id")}, {"$set": _product_doc(shop, p, sync_id)}, upsert=True)
+        for p in products if p.get("id") is not None
+    ]
+    if ops: await product_collection.bulk_write(ops, ordered=False)
+    return len(ops)
+
+async def delete_product(shop, product_id):
+    await product_collection.delete_one({"shop": shop, "product_id": product_id})
+
+
+# --- Sync ---
+async def sync_products(shop, token, full=False):
+    """
+    Incremental by default (products changed since the last sync). A full sync
+    re-reads everything and removes products that no longer exist.
+    """
+    lock = _sync_locks.setdefault(shop, asyncio.Lock())
+    async with lock:
+        store = await shop_collection.find_one({"shop": shop}, {"products_synced_at": 1, "products_full_synced_at": 1})
+        last_sync = (store or {}).get("products_synced_at")
+        full = full or not last_sync
+        started_at = datetime.utcnow()
+        sync_id = uuid.uuid4().hex if full else None
+
+        params = {}
+        if not full: params["updated_at_min"] = (last_sync - SYNC_OVERLAP).isoformat() + "Z"
+
+        count = 0
+        async for page in iter_product_pages(shop, token, params):
+            count += await upsert_products(shop, page, sync_id)
+
+        update = {"products_synced_at": started_at}
+        if full:
+            removed = await product_collection.delete_many({"shop": shop, "sync_id": {"$ne": sync_id}})
+            update["products_full_synced_at"] = started_at
+            logger.info(f"🗂️ Full product sync for {shop}: {count} upserted, {removed.deleted_count} removed")
+        else:
+            logger.info(f"🗂️ Incremental product sync for {shop}: {count} changed")
+        await shop_collection.update_one({"shop": shop}, {"$set": update})
+        return count
+
+def schedule_sync(shop, token, full=False):
+    """Fire-and-forget sync on the API loop (at most one running per shop)."""
+    if _sync_locks.get(shop) and _sync_locks[shop].locked(): return
+
+    async def run():
+        try: await sync_products(shop, token, full=full)
+        except Exception as e: logger.error(f"❌ Product sync failed for {shop}: {e}")
+
+    task = asyncio.create_task(run())
+    _background_syncs.add(task)
+    task.add_done_callback(_background_syncs.discard)
+
+def sync_needed(store):
+    """None (fresh), "incremental" or "full" for a shop_collection document."""
+    now = datetime.utcnow()
+    last = store.get("products_synced_at")
+    last_full = store.get("products_full_synced_at")
+    if not last or not last_full or now - last_full > FULL_SYNC_INTERVAL: return "full"
+    if now - last > PRODUCT_SYNC_INTERVAL: return "incremental"
+    return None
+
+
+# --- Query ---
+async def search_products(shop, search=None, page=1, page_size=50):
+    """Indexed local query: text search over title/vendor/tags, or title order when browsing."""
+    query = {"shop": shop}
+    projection = {"_id": 0, "data": 1}
+    if search:
+        query["$text"] = {"$search": search}
+        projection["score"] = {"$meta": "textScore"}
+        cursor = product_collection.find(query, projection).sort([("score", {"$meta": "textScore"})])
+    else:
+        cursor = product_collection.find(query, projection).sort("title_sort", ASCENDING)
+
+    skip = (page - 1) * page_size
+    products = [doc["data"] async for doc in cursor.skip(skip).limit(page_size)]
+    total = await product_collection.count_documents(query)
+    return products, total
+
+
+# --- Webhooks ---
+async def register_product_webhooks(shop, token):
+    address = f"{BASE_PUBLIC_URL}/api/webhooks/products"
+    for topic in WEBHOOK_TOPICS:
+        response = await shopify_post(shop, token, "/webhooks.json", {"webhook": {"topic": topic, "address": address, "format": "json"}})
+        # 422 = already registered for this address
+        if response.status_code not in (200, 201, 422):
+            logger.error(f"❌ Webhook registration failed for {shop} {topic}: {response.text[:300]}")
@@ -0,0 +1,129 @@
+import time
+import threading
+from datetime import datetime
+
+
+class ProgressReporter:
+    """
+    Write-behind progress for one job.
+
+    `update()` never touches Mongo: it merges the fields into a pending
+    update and returns. A background thread flushes the latest pending state
+    when it is worth it:
+      * the stage changed, or
+      * progress moved by >= min_delta and min_interval has passed since the last flush, or
+      * anything is pending and max_interval has passed (so small steps still land).
+    `finish()` writes terminal states synchronously, folding in whatever was
+    still pending, so "done"/"failed" are never lost or overwritten.
+
+    `on_flush(job_id, fields)` runs after every successful write (used to
+    push the change to live status streams).
+
+    `guard` is extra filter for every write, e.g. {"status": {"$ne": "failed"}}
+    so a stage running in parallel cannot resurrect a job that already
+    failed; writes that match nothing are not pushed to on_flush either.
+    """
+
+    def __init__(self, collection, job_id, min_interval=1.0, min_delta=2, max_interval=5.0, on_flush=None, guard=None):
+        self.collection = collection
+        self.job_id = job_id
+        self.on_flush = on_flush
+        self.guard = guard or {}
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.max_interval = max_interval
+
+        self._cond = threading.Condition()
+        self._pending = None
+        self._closed = False
+        self._last_flush_at = 0.0
+        self._last_progress = None
+        self._last_stage = None
+        self._thread = None
+
+        # 📊 Tuning counters
+        self.updates = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self._flush_seconds_total = 0.0
+        self._flush_seconds_max = 0.0
+
+    # --- Public API ---
+    def update(self, percent, **info):
+        """Progress callback for generate_video_from_images (same signature)."""
+        fields = {"progress": percent, "status": "processing"}
+        fields.update({k: v for k, v in info.items() if v is not None})
+        with self._cond:
+            if self._closed: return
+            self.updates += 1
+            self._pending = {**(self._pending or {}), **fields}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"progress-{self.job_id[:8]}", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    __call__ = update
+
+    def finish(self, status, **fields):
+        """Persists a terminal state right away (blocking) and stops the flusher."""
+        with self._cond:
+            self._closed = True
+            pending = self._pending or {}
+            self._pending = None
+            self._cond.notify()
+        if self._thread: self._thread.join(timeout=10)
+
+        final = {k: v for k, v in pending.items() if k not in ("progress", "status", "eta_seconds")}
+        final.update(fields)
+        final["status"] = status
+        final["progress_stats"] = self.stats()
+        self._write(final)
+        print(f"📈 Progress writes for {self.job_id}: {final['progress_stats']}")
+
+    def stats(self):
+        return {
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "coalesced": max(0, self.updates - self.flushes),
+            "flush_errors": self.flush_errors,
+            "avg_flush_ms": round(1000 * self._flush_seconds_total / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(1000 * self._flush_seconds_max, 2),
+        }
+
+    # --- Internals ---
+    def _due(self, now):
+        pending = self._pending
+        if pending is None: return False
+        since = now - self._last_flush_at
+        if pending.get("stage") is not None and pending.get("stage") != self._last_stage: return True
+        if since >= self.max_interval: return True
+        progress = pending.get("progress")
+        moved = self._last_progress is None or (progress is not None and abs(progress - self._last_progress) >= self.min_delta)
+        return moved and since >= self.min_interval
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._due(time.monotonic()):
+                    self._cond.wait(timeout=self.min_interval / 2)
+                if self._closed: return
+                fields, self._pending = self._pending, None
+                self._last_flush_at = time.monotonic()
+                self._last_progress = fields.get("progress", self._last_progress)
+                self._last_stage = fields.get("stage", self._last_stage)
+            self._write(fields)
+
+    def _write(self, fields):
+        fields = {**fields, "updated_at": datetime.utcnow()}
+        started = time.monotonic()
+        try:
+            result = self.collection.update_one({"job_id": self.job_id, **self.guard}, {"$set": fields})
+            if self.on_flush and result.matched_count: self.on_flush(self.job_id, fields)
+        except Exception as e:
+            self.flush_errors += 1
+            print(f"⚠️ Progress write failed for {self.job_id}: {e}")
+        finally:
+            elapsed = time.monotonic() - started
+            self.flushes += 1
+            self._flush_seconds_total += elapsed
+            self._flush_seconds_max = max(self._flush_seconds_max, elapsed)
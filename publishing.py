@@ -0,0 +1,218 @@
+import time
+import uuid
+import asyncio
+import threading
+from datetime import datetime
+
+import httpx
+from bson import ObjectId
+
+import rate_limit
+from redis_client import get_redis, get_async_redis
+from config import BASE_PUBLIC_URL, IG_USER_ID
+
+# 📣 Social publishing, run by `publish_video_task` on the "publish" Celery queue.
+#    Every attempt is keyed by publish_job_id: a Redis lock stops duplicate
+#    deliveries from running side by side, and platforms that already
+#    succeeded are skipped when the task is retried.
+GRAPH_URL = "https://graph.facebook.com/v21.0"
+PLATFORMS = ("instagram", "facebook")
+
+# Container status polling: 1s, 2s, 4s ... capped at 15s between checks, 3 minutes overall
+POLL_INITIAL_DELAY = 1.0
+POLL_MAX_DELAY = 15.0
+POLL_TIMEOUT = 180.0
+
+# (max publishes, window seconds): shared by all accounts / per access token
+PLATFORM_RATE_LIMITS = {"instagram": (30, 60), "facebook": (30, 60)}
+TOKEN_RATE_LIMITS = {"instagram": (25, 24 * 3600), "facebook": (50, 3600)}
+
+PUBLISH_LOCK_SECONDS = 15 * 60 # longer than one attempt can take
+FINAL_STATUSES = ("succeeded", "partial_failure", "failed")
+RETRYABLE_STATUSES = ("rate_limited", "retrying")
+METRICS_PREFIX = "publish_metrics:"
+THROUGHPUT_PREFIX = "publish_throughput:"
+
+
+# --- Worker event loop ---
+# One long-lived loop per worker process (on its own thread), so the pooled
+# Graph client keeps its connections between tasks.
+_loop = None
+_loop_lock = threading.Lock()
+_graph_client = None
+
+def run_async(coro):
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="publish-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+def get_graph_client():
+    global _graph_client
+    if _graph_client is None or _graph_client.is_closed:
+        _graph_client = httpx.AsyncClient(base_url=GRAPH_URL, timeout=httpx.Timeout(30.0), limits=httpx.Limits(max_connections=20))
+    return _graph_client
+
+
+# --- Graph API ---
+async def wait_for_container(creation_id, access_token):
+    """Polls an IG media container with exponential backoff. Returns (finished, last_status)."""
+    delay, waited, check = POLL_INITIAL_DELAY, 0.0, {}
+    while waited < POLL_TIMEOUT:
+        await asyncio.sleep(delay)
+        waited += delay
+        check = (await get_graph_client().get(f"/{creation_id}", params={"fields": "status_code,status", "access_token": access_token})).json()
+        if check.get("status_code") == "FINISHED": return True, check
+        if check.get("status_code") == "ERROR": return False, check
+        delay = min(delay * 2, POLL_MAX_DELAY)
+    return None, check
+
+async def perform_instagram_upload(access_token, video_url, caption):
+    client = get_graph_client()
+    try:
+        payload = { "video_url": video_url, "media_type": "REELS", "caption": caption, "access_token": access_token }
+        data = (await client.post(f"/{IG_USER_ID}/media", data=payload)).json()
+        if "id" not in data: return False, f"Container Error: {data.get('error', {}).get('message')}"
+        creation_id = data["id"]
+
+        finished, check = await wait_for_container(creation_id, access_token)
+        if finished is False: return False, f"Processing Error: {check}"
+
+        pub_data = (await client.post(f"/{IG_USER_ID}/media_publish", data={"creation_id": creation_id, "access_token": access_token})).json()
+        return ("id" in pub_data), pub_data.get("id") or pub_data.get('error', {}).get('message')
+    except httpx.TransportError: raise
+    except Exception as e: return False, str(e)
+
+async def perform_facebook_upload(access_token, video_url, caption):
+    client = get_graph_client()
+    try:
+        resp = (await client.get("/me/accounts", params={"access_token": access_token})).json()
+        if not resp.get("data"): return False, "No Facebook Pages found."
+        page = resp["data"][0]
+        res = (await client.post(f"/{page['id']}/videos", params={"file_url": video_url, "description": caption, "access_token": page['access_token']})).json()
+        return ("id" in res), res.get("id") or res.get('error', {}).get('message')
+    except httpx.TransportError: raise
+    except Exception as e: return False, str(e)
+
+async def publish_to_platform(platform, acc, video_url, caption):
+    """One platform, one attempt. Network errors and rate limits come back retryable."""
+    if platform not in PLATFORMS: return {"status": "failed", "error": f"Unsupported platform: {platform}"}
+    if not acc: return {"status": "failed", "error": "Account not connected"}
+
+    token = acc['token_data']['access_token']
+    wait = rate_limit.acquire_all([
+        (f"publish:{platform}", *PLATFORM_RATE_LIMITS[platform]),
+        (f"publish:{platform}:{rate_limit.token_fingerprint(token)}", *TOKEN_RATE_LIMITS[platform]),
+    ])
+    if wait:
+        record_metric(platform, "rate_limited")
+        return {"status": "rate_limited", "retry_in": wait}
+
+    started = time.monotonic()
+    try:
+        if platform == "instagram": success, result_msg = await perform_instagram_upload(token, video_url, caption)
+        else: success, result_msg = await perform_facebook_upload(token, video_url, caption)
+        result = {"status": "success", "post_id": result_msg} if success else {"status": "failed", "error": result_msg}
+    except httpx.TransportError as e:
+        result = {"status": "retrying", "error": str(e)}
+    except Exception as e:
+        result = {"status": "failed", "error": str(e)}
+    record_metric(platform, result["status"], time.monotonic() - started)
+    return result
+
+
+# --- Job runner (worker side, sync) ---
+def run_publish_job(publish_job_id, publish_collection, social_collection, final_attempt=False):
+    """
+    Publishes whatever is still pending for one publish job.
+    Returns {"status": ...}; "retrying" comes with "retry_in" (seconds, 0 = caller picks the backoff).
+    """
+    redis = get_redis()
+    lock_key, owner = f"publish_lock:{publish_job_id}", uuid.uuid4().hex
+    if not redis.set(lock_key, owner, nx=True, ex=PUBLISH_LOCK_SECONDS):
+        print(f"⏭️ Publish {publish_job_id} is already running elsewhere")
+        return {"status": "locked"}
+
+    try:
+        job_filter = {"_id": ObjectId(publish_job_id)}
+        job = publish_collection.find_one(job_filter, {"video_filename": 1, "caption": 1, "platforms": 1, "status": 1, "platform_results": 1})
+        if not job: return {"status": "not_found"}
+        if job.get("status") in FINAL_STATUSES: return {"status": job["status"]}
+
+        results = job.get("platform_results") or {}
+        pending = [p for p in job.get("platforms", []) if results.get(p, {}).get("status") != "success"]
+        publish_collection.update_one(job_filter, {"$set": {"status": "processing", "started_at": datetime.utcnow()}, "$inc": {"attempts": 1}})
+
+        video_url = f"{BASE_PUBLIC_URL}/static/{job['video_filename']}"
+        connected = {}
+        for acc in social_collection.find({"platform": {"$in": pending}}, {"platform": 1, "token_data": 1}):
+            connected.setdefault(acc["platform"], acc)
+
+        def record(platform, result):
+            # Persist each platform as soon as it lands so a crash never re-posts it
+            publish_collection.update_one(job_filter, {"$set": {f"platform_results.{platform}": result}})
+
+        async def publish_one(platform):
+            result = await publish_to_platform(platform, connected.get(platform), video_url, job.get("caption") or "")
+            await asyncio.to_thread(record, platform, result)
+            return result
+
+        async def publish_all():
+            return await asyncio.gather(*[publish_one(p) for p in pending])
+
+        results.update(zip(pending, run_async(publish_all())))
+
+        retryable = [r for r in results.values() if r["status"] in RETRYABLE_STATUSES]
+        if retryable and not final_attempt:
+            publish_collection.update_one(job_filter, {"$set": {"status": "retrying"}})
+            return {"status": "retrying", "retry_in": max(r.get("retry_in", 0) for r in retryable)}
+
+        # Final attempt: whatever is still throttled / unreachable has failed for good
+        for platform, r in results.items():
+            if r["status"] in RETRYABLE_STATUSES:
+                reason = "Rate limited" if r["status"] == "rate_limited" else (r.get("error") or "Network error")
+                results[platform] = {"status": "failed", "error": f"{reason} (retries exhausted)"}
+
+        overall_status = "succeeded" if all(r["status"] == "success" for r in results.values()) else "partial_failure"
+        if not any(r["status"] == "success" for r in results.values()): overall_status = "failed"
+        publish_collection.update_one(job_filter, {"$set": {"status": overall_status, "platform_results": results, "completed_at": datetime.utcnow()}})
+        return {"status": overall_status}
+    finally:
+        try:
+            if redis.get(lock_key) == owner: redis.delete(lock_key)
+        except Exception as e: print(f"⚠️ Could not release publish lock {publish_job_id}: {e}")
+
+
+# --- Metrics ---
+def record_metric(platform, status, seconds=None):
+    """Per-platform counters in Redis, shared by every worker. Best effort."""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hincrby(f"{METRICS_PREFIX}{platform}", status, 1)
+        if seconds is not None: pipe.hincrbyfloat(f"{METRICS_PREFIX}{platform}", "seconds_total", seconds)
+        if status == "success":
+            minute_key = f"{THROUGHPUT_PREFIX}{platform}:{int(time.time() // 60)}"
+            pipe.incr(minute_key)
+            pipe.expire(minute_key, 2 * 3600)
+        pipe.execute()
+    except Exception as e:
+        print(f"⚠️ Publish metric write failed: {e}")
+
+async def read_publish_metrics():
+    redis = get_async_redis()
+    minute = int(time.time() // 60)
+    metrics = {}
+    for platform in PLATFORMS:
+        raw = await redis.hgetall(f"{METRICS_PREFIX}{platform}")
+        counts = {status: int(raw.get(status, 0)) for status in ("success", "failed", "retrying", "rate_limited")}
+        attempted = counts["success"] + counts["failed"] + counts["retrying"]
+        recent = await redis.mget([f"{THROUGHPUT_PREFIX}{platform}:{m}" for m in range(minute - 59, minute + 1)])
+        metrics[platform] = {
+            **counts,
+            "success_rate": round(counts["success"] / attempted, 3) if attempted else None,
+            "avg_seconds": round(float(raw.get("seconds_total", 0)) / attempted, 2) if attempted else None,
+            "published_last_hour": sum(int(v) for v in recent if v),
+        }
+    return metrics
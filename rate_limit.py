@@ -0,0 +1,42 @@
+import time
+import hashlib
+from redis_client import get_redis
+
+
+def token_fingerprint(token):
+    """Rate-limit keys never contain the raw access token."""
+    return hashlib.sha256((token or "").encode()).hexdigest()[:16]
+
+def _take(key, limit, window):
+    """
+    Fixed-window limiter shared by every worker through Redis.
+    Returns (wait, redis_key): wait is 0 when a slot was taken, otherwise the seconds until the window resets.
+    """
+    now = time.time()
+    bucket = int(now // window)
+    redis_key = f"ratelimit:{key}:{bucket}"
+    pipe = get_redis().pipeline()
+    pipe.incr(redis_key)
+    pipe.expire(redis_key, int(window) + 1)
+    count, _ = pipe.execute()
+    if count <= limit: return 0, redis_key
+    return round(window - (now % window), 1), redis_key
+
+def acquire_all(limits):
+    """
+    limits: [(key, limit, window), ...]. All or nothing: when any limit
+    rejects, the slots already taken are given back (so a throttled token
+    does not burn the platform-wide quota) and its wait is returned.
+    """
+    taken = []
+    for key, limit, window in limits:
+        wait, redis_key = _take(key, limit, window)
+        taken.append(redis_key) # a rejected INCR is undone too, retries must not inflate the window
+        if wait:
+            try:
+                pipe = get_redis().pipeline()
+                for k in taken: pipe.decr(k)
+                pipe.execute()
+            except Exception as e: print(f"⚠️ Could not return rate-limit slots: {e}")
+            return wait
+    return 0
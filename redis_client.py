@@ -0,0 +1,20 @@
+import redis
+import redis.asyncio as aioredis
+from config import REDIS_URL
+
+_client = None
+_async_client = None
+
+def get_redis():
+    """Process-wide Redis client (redis-py pools connections and is thread-safe)."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=5)
+    return _client
+
+def get_async_redis():
+    """Process-wide asyncio Redis client for the API's event loop."""
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _async_client
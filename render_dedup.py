@@ -0,0 +1,106 @@
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from redis_client import get_redis, get_async_redis
+from config import DEDUP_WINDOW_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 🪪 Render single-flight. An identical request (same images, copy, voice,
+#    duration, tone, theme, outputs, music upload and brand kit) gets the job
+#    that is already running or finished within DEDUP_WINDOW_SECONDS instead of
+#    a new one. `render_fp:<fingerprint>` holds the owning job id: claimed with
+#    SET NX while in flight, kept for the window once done, dropped on failure.
+FINGERPRINT_VERSION = 1 # bump when the render output for the same inputs changes
+KEY_PREFIX = "render_fp:"
+INFLIGHT_TTL_SECONDS = 2 * 3600 # a stuck job stops blocking new attempts after this
+LIVE_STATUSES = ("queued", "processing")
+
+
+def _clean(value):
+    return " ".join(value.split()) if isinstance(value, str) else value
+
+def request_fingerprint(image_urls, product_title, product_desc, logo_url, voice_gender, duration, script_tone,
+                        video_theme, shop_name, renditions, template_id="none", brand_settings=None, music_digest=None):
+    """sha256 over the normalized request (image order matters, whitespace/case noise does not)."""
+    payload = {
+        "v": FINGERPRINT_VERSION,
+        "image_urls": [u.strip() for u in image_urls or [] if u and u.strip()],
+        "title": _clean(product_title),
+        "desc": _clean(product_desc),
+        "logo_url": (logo_url or "").strip() or None,
+        "voice": (voice_gender or "").lower(),
+        "duration": int(duration),
+        "tone": (script_tone or "").lower(),
+        "theme": (video_theme or "").lower(),
+        "shop": shop_name,
+        "renditions": list(renditions),
+        "template": template_id or "none",
+        "brand": brand_settings or {},
+        "music": music_digest,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# --- API side ---
+async def claim_fingerprint(fingerprint, job_id, jobs_collection):
+    """
+    Returns None when `job_id` now owns the fingerprint (go ahead and render),
+    otherwise the id of the live or recently finished job to hand back.
+    """
+    key = f"{KEY_PREFIX}{fingerprint}"
+    try:
+        redis = get_async_redis()
+        if await redis.set(key, job_id, nx=True, ex=INFLIGHT_TTL_SECONDS): return None
+        owner = await redis.get(key)
+    except Exception as e:
+        # Redis down: fall back to the job collection (no single-flight guarantee, but no duplicate of a finished job)
+        logger.warning(f"⚠️ Fingerprint claim failed, using Mongo: {e}")
+        since = datetime.utcnow() - timedelta(seconds=DEDUP_WINDOW_SECONDS)
+        job = await jobs_collection.find_one(
+            {"fingerprint": fingerprint, "job_id": {"$ne": job_id}, "created_at": {"$gte": since}, "status": {"$in": [*LIVE_STATUSES, "done"]}},
+            {"_id": 0, "job_id": 1}, sort=[("created_at", -1)]
+        )
+        return job["job_id"] if job else None
+
+    job = await jobs_collection.find_one({"job_id": owner}, {"_id": 0, "status": 1}) if owner else None
+    if job and job.get("status") in (*LIVE_STATUSES, "done"): return owner
+
+    # The owner failed or vanished: take over (only one contender wins the swap)
+    try:
+        previous = await redis.set(key, job_id, ex=INFLIGHT_TTL_SECONDS, get=True)
+        if previous in (owner, None): return None
+        # Another request took over first: give its claim back and attach to it
+        await redis.set(key, previous, ex=INFLIGHT_TTL_SECONDS)
+        return previous
+    except Exception:
+        return None
+
+async def release_fingerprint_async(fingerprint, job_id):
+    key = f"{KEY_PREFIX}{fingerprint}"
+    try:
+        redis = get_async_redis()
+        if await redis.get(key) == job_id: await redis.delete(key)
+    except Exception as e: logger.warning(f"⚠️ Fingerprint release failed: {e}")
+
+
+# --- Worker side ---
+def settle_fingerprint(fingerprint, job_id):
+    """Job finished: identical requests keep getting it for DEDUP_WINDOW_SECONDS."""
+    if not fingerprint: return
+    key = f"{KEY_PREFIX}{fingerprint}"
+    try:
+        redis = get_redis()
+        if redis.get(key) == job_id: redis.expire(key, DEDUP_WINDOW_SECONDS)
+    except Exception as e: print(f"⚠️ Fingerprint settle failed: {e}")
+
+def release_fingerprint(fingerprint, job_id):
+    """Job failed: the next identical request renders again."""
+    if not fingerprint: return
+    key = f"{KEY_PREFIX}{fingerprint}"
+    try:
+        redis = get_redis()
+        if redis.get(key) == job_id: redis.delete(key)
+    except Exception as e: print(f"⚠️ Fingerprint release failed: {e}")
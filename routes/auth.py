@@ -5,6 +5,7 @@ from fastapi import APIRouter, Request
 from fastapi.responses import RedirectResponse, HTMLResponse
 from authlib.integrations.starlette_client import OAuth
 from database import shop_collection, social_collection
+from product_catalog import register_product_webhooks, schedule_sync
 from config import *
 
 router = APIRouter()
@@ -52,6 +53,9 @@ async def shopify_callback(shop: str, code: str):
         data = resp.json()
         if "access_token" in data:
             await shop_collection.update_one({"shop": shop}, {"$set": {"access_token": data["access_token"], "updated_at": datetime.utcnow()}}, upsert=True)
+            # 🗂️ Start mirroring the catalog right away and subscribe to product changes
+            await register_product_webhooks(shop, data["access_token"])
+            schedule_sync(shop, data["access_token"], full=True)
     except Exception as e: print(f"❌ Auth Error: {e}")
     return RedirectResponse(f"https://{shop}/admin/apps/{SHOPIFY_API_KEY}")
 
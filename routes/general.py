@@ -1,9 +1,19 @@
-import requests
+import json
+import hmac
+import base64
+import hashlib
 import logging
 from datetime import datetime
-from fastapi import APIRouter, Query, HTTPException
+from celery.result import AsyncResult
+from fastapi import APIRouter, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from database import shop_collection, review_collection, social_collection, brand_collection
 from models import ReviewRequest, BrandSettingsRequest
+from tasks import celery_app, prefetch_images_task
+from shopify_client import iter_product_pages, ShopifyAPIError
+from product_catalog import search_products, sync_needed, schedule_sync, upsert_products, delete_product
+from brand_cache import get_brand_settings_async, invalidate_brand_settings
+from config import SHOPIFY_API_SECRET
 
 # Set up logging to see Shopify errors in your terminal
 logging.basicConfig(level=logging.INFO)
@@ -12,14 +22,23 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/api/products")
-async def get_products(shop: str = None, search: str = Query(None)):
-    """Fetches product list from Shopify using the stored access token."""
+async def get_products(
+    shop: str = None,
+    search: str = Query(None),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=250),
+    live: bool = Query(False)
+):
+    """
+    Lists / searches the shop's products from the local catalog mirror.
+    `live=true` (or a shop that has never been synced) streams straight from Shopify instead.
+    """
     if not shop:
         logger.warning("Request received without shop parameter.")
         return {"products": []}
 
     # 1. Fetch store data from MongoDB to get the token
-    store_data = await shop_collection.find_one({"shop": shop})
+    store_data = await shop_collection.find_one({"shop": shop}, {"access_token": 1, "products_synced_at": 1, "products_full_synced_at": 1})
     
     # If no store found, tell frontend that re-auth is needed
     if not store_data or "access_token" not in store_data:
@@ -27,55 +46,108 @@ async def get_products(shop: str = None, search: str = Query(None)):
         return {"error": "auth_needed", "message": "Please re-install the app."}
     
     token = store_data["access_token"]
-    headers = {
-        "X-Shopify-Access-Token": token,
-        "Content-Type": "application/json"
-    }
-    
-    # Using the latest stable Shopify API version
-    url = f"https://{shop}/admin/api/2024-01/products.json"
-    params = {"limit": 50}
-    
+
+    # 2. Keep the mirror fresh in the background; never block the listing on Shopify
+    needed = sync_needed(store_data)
+    if needed: schedule_sync(shop, token, full=(needed == "full"))
+    if live or not store_data.get("products_synced_at"):
+        return await stream_live_products(shop, token, search)
+
+    # 3. Local indexed query
     try:
-        logger.info(f"Fetching products from Shopify for: {shop}")
-        r = requests.get(url, headers=headers, params=params)
-        
-        # Log exactly what Shopify sends back for debugging
-        logger.info(f"Shopify Status Code: {r.status_code}")
-        data = r.json()
-        
-        if r.status_code != 200:
-            logger.error(f"Shopify API Error: {data}")
-            return {"products": [], "error": "api_failure", "details": data}
-
-        all_products = data.get("products", [])
-        logger.info(f"Successfully retrieved {len(all_products)} products.")
-
-        if search:
-            filtered = [p for p in all_products if search.lower() in p.get('title', '').lower()]
-            return {"products": filtered}
-            
-        return {"products": all_products}
+        products, total = await search_products(shop, search, page, page_size)
+    except Exception as e:
+        logger.error(f"Catalog query failed for {shop}, falling back to Shopify: {str(e)}")
+        return await stream_live_products(shop, token, search)
+    return {"products": products, "total": total, "page": page, "page_size": page_size}
+
+async def stream_live_products(shop, token, search=None):
+    """Streams the shop's full product list from Shopify (all pages)."""
+    logger.info(f"Fetching products from Shopify for: {shop}")
+    pages = iter_product_pages(shop, token)
 
+    # First page before we commit to a 200, so API failures keep their old response shape
+    try:
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = []
+    except ShopifyAPIError as e:
+        logger.error(f"Shopify API Error: {e.details}")
+        return {"products": [], "error": "api_failure", "details": e.details}
     except Exception as e:
         logger.error(f"Unexpected error in get_products: {str(e)}")
         return {"products": [], "error": str(e)}
 
+    needle = search.lower() if search else None
+
+    async def stream_products():
+        # 🟢 Pages are streamed to the client as they arrive from Shopify
+        yield '{"products": ['
+        count = 0
+        page = first_page
+        try:
+            while page is not None:
+                for product in page:
+                    if needle and needle not in product.get('title', '').lower(): continue
+                    yield ("," if count else "") + json.dumps(product)
+                    count += 1
+                try: page = await pages.__anext__()
+                except StopAsyncIteration: page = None
+        except Exception as e:
+            # Headers are already sent; end the JSON cleanly with what we have
+            logger.error(f"Product pagination stopped early for {shop}: {str(e)}")
+        finally:
+            await pages.aclose()
+        logger.info(f"Successfully streamed {count} products.")
+        yield "]}"
+
+    return StreamingResponse(stream_products(), media_type="application/json")
+
+@router.post("/api/webhooks/products")
+async def product_webhook(request: Request):
+    """Shopify products/create|update|delete webhooks keep the local catalog in sync."""
+    body = await request.body()
+    digest = base64.b64encode(hmac.new((SHOPIFY_API_SECRET or "").encode(), body, hashlib.sha256).digest()).decode()
+    if not hmac.compare_digest(digest, request.headers.get("X-Shopify-Hmac-Sha256", "")):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    shop = request.headers.get("X-Shopify-Shop-Domain")
+    topic = request.headers.get("X-Shopify-Topic", "")
+    product = json.loads(body or b"{}")
+    if topic == "products/delete":
+        await delete_product(shop, product.get("id"))
+    else:
+        await upsert_products(shop, [product])
+    return {"status": "success"}
+
 @router.post("/api/cache-images")
 async def cache_images(request: dict):
     """
-    Receives image URLs from the frontend to trigger background 
-    pre-processing before video generation starts.
+    Receives image URLs from the frontend and queues a warm-up job that downloads,
+    validates and letterboxes them into the image cache before generation starts.
     """
     images = request.get("images", [])
     if not images:
         return {"status": "ignored", "reason": "no images provided"}
-    
-    # This prevents the 404 error in your logs
-    logger.info(f"🚀 Background Caching Started: {len(images)} images received for pre-processing.")
-    
-    # Future: You can add logic here to download/resize images to the 'temp' folder
-    return {"status": "success", "message": "Caching initiated"}
+
+    try:
+        task = prefetch_images_task.delay(images, request.get("logo_url"), request.get("renditions"))
+    except Exception as e:
+        logger.error(f"❌ Could not queue prefetch: {str(e)}")
+        return {"status": "failed", "error": "Could not connect to Worker."}
+
+    logger.info(f"🚀 Background Caching Queued: {len(images)} images (prefetch {task.id})")
+    return {"status": "queued", "prefetch_id": task.id}
+
+@router.get("/api/cache-images/{prefetch_id}")
+async def cache_images_status(prefetch_id: str):
+    """Lets the client check whether warming finished before it starts a render."""
+    result = AsyncResult(prefetch_id, app=celery_app)
+    if result.successful():
+        return {"status": "done", **result.result}
+    if result.failed():
+        return {"status": "failed", "error": str(result.result)}
+    return {"status": "processing" if result.state == "STARTED" else "queued"}
 
 @router.post("/api/reviews")
 async def add_review(review: ReviewRequest):
@@ -101,7 +173,7 @@ async def get_reviews():
 @router.get("/api/social-accounts")
 async def get_accounts():
     accounts = []
-    async for doc in social_collection.find({}):
+    async for doc in social_collection.find({}, {"platform": 1}):
         accounts.append({"id": str(doc["_id"]), "platform": doc.get("platform")})
     return {"status": "success", "accounts": accounts}
 
@@ -113,15 +185,9 @@ async def save_brand_settings(settings: BrandSettingsRequest):
         {"$set": settings.dict()}, 
         upsert=True
     )
+    await invalidate_brand_settings(settings.shop)
     return {"status": "success"}
 
 @router.get("/api/get-brand-settings")
 async def get_brand_settings(shop: str):
-    data = await brand_collection.find_one({"shop": shop})
-    if data:
-        data.pop("_id", None)
-    return data or {}
-@router.post("/api/cache-images")
-async def cache_images(request: dict):
-    # This matches the call in ProductDetail.jsx
-    return {"status": "success", "message": "Caching acknowledged"}
\ No newline at end of file
+    return await get_brand_settings_async(brand_collection, shop) or {}
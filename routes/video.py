@@ -1,20 +1,41 @@
 import uuid
 import json
-import shutil
+import hashlib
+import asyncio
 import os
 import logging
 from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, Form, File, UploadFile
-from database import video_jobs_collection
+from fastapi import APIRouter, Form, File, UploadFile, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+from database import video_jobs_collection, batch_jobs_collection, brand_collection
 from config import VIDEO_DIR
+from models import BatchRenderRequest, VariantRenderRequest
+from job_events import job_status_hub, status_payload, STATUS_FIELDS, TERMINAL_STATUSES
 
 # 🟢 Import the task directly from tasks.py
-from tasks import process_video_job_task 
+from tasks import process_batch_task, process_variant_job_task, prepare_render_task
+from pipeline import start_render_pipeline
+from utils import resolve_renditions
+from brand_cache import get_brand_settings_async
+from render_dedup import request_fingerprint, claim_fingerprint, release_fingerprint_async
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+STATUS_PROJECTION = {"_id": 0, "job_id": 1, **{f: 1 for f in STATUS_FIELDS}}
+SSE_HEARTBEAT_SECONDS = 15
+SSE_POLL_FALLBACK_SECONDS = 2
+SSE_MAX_JOBS = 50
+
+def parse_rendition_names(raw):
+    """Form value -> rendition names: a JSON list of strings or comma-separated names. ValueError for anything else."""
+    if not raw: return None
+    try: parsed = json.loads(raw)
+    except ValueError: return [r.strip() for r in raw.split(",") if r.strip()]
+    if isinstance(parsed, list) and all(isinstance(name, str) for name in parsed): return parsed
+    raise ValueError("renditions must be a JSON list of names or a comma-separated string")
+
 @router.post("/api/start-video-generation")
 async def start_gen(
     image_urls: str = Form(...), 
@@ -26,66 +47,268 @@ async def start_gen(
     script_tone: str = Form("Professional"), 
     video_theme: str = Form("Modern"), 
     music_file: UploadFile = File(None),
-    shop_name: str = Form(...)
+    shop_name: str = Form(...),
+    regenerate: bool = Form(False),
+    renditions: Optional[str] = Form(None)
 ):
     job_id = str(uuid.uuid4())
     logger.info(f"🚀 [BACKEND] Initiating video job {job_id} for store: {shop_name}")
 
-    # 1. Save 'queued' status to MongoDB
-    new_job = { 
-        "job_id": job_id, 
-        "status": "queued", 
-        "progress": 0, 
-        "created_at": datetime.utcnow(), 
-        "shop_name": shop_name, 
-        "title": product_title 
-    }
-    await video_jobs_collection.insert_one(new_job)
-
-    # 2. Parse images
+    # 1. Parse images
     try: 
         images_list = json.loads(image_urls)
     except Exception as e:
         logger.error(f"Failed to parse image URLs: {e}")
         images_list = []
     
-    # 3. Handle Music
-    custom_music_path = None
+    # 1b. Output ladder: JSON list or comma-separated names (unknown names are ignored)
+    try: renditions_list = parse_rendition_names(renditions)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "failed", "error": str(e)})
+
+    # 2. Handle Music
+    custom_music_path, music_digest = None, None
     if music_file:
         custom_music_path = os.path.join(VIDEO_DIR, f"bgm_{job_id}.mp3")
+        digest = hashlib.sha256()
         with open(custom_music_path, "wb") as buffer:
-            shutil.copyfileobj(music_file.file, buffer)
-            
-    # 4. 🟢 SEND TO CELERY
+            for chunk in iter(lambda: music_file.file.read(1 << 20), b""):
+                digest.update(chunk)
+                buffer.write(chunk)
+        music_digest = digest.hexdigest()
+
+    # 3. 🪪 Single-flight: an identical request gets the running / recently finished job
+    #    (`regenerate` explicitly asks for a fresh render)
+    fingerprint = request_fingerprint(
+        images_list, product_title, product_desc, logo_url, voice_gender, duration, script_tone, video_theme,
+        shop_name, resolve_renditions(renditions_list),
+        brand_settings=await get_brand_settings_async(brand_collection, shop_name), music_digest=music_digest
+    )
+
+    # 3b. Save 'queued' status to MongoDB (before claiming, so a racing duplicate sees a live owner)
+    new_job = { 
+        "job_id": job_id, 
+        "status": "queued", 
+        "progress": 0, 
+        "created_at": datetime.utcnow(), 
+        "shop_name": shop_name, 
+        "title": product_title,
+        "fingerprint": fingerprint
+    }
+    await video_jobs_collection.insert_one(new_job)
+
+    if not regenerate:
+        existing_job_id = await claim_fingerprint(fingerprint, job_id, video_jobs_collection)
+        if existing_job_id:
+            await video_jobs_collection.delete_one({"job_id": job_id})
+            if custom_music_path and os.path.exists(custom_music_path): os.remove(custom_music_path)
+            logger.info(f"🪪 [BACKEND] Duplicate request, returning job {existing_job_id}")
+            # A finished render comes back with its url right away; a running one with its progress
+            existing = await video_jobs_collection.find_one({"job_id": existing_job_id}, STATUS_PROJECTION) or {"status": "queued"}
+            return {**status_payload(existing_job_id, existing), "deduplicated": True}
+
+    # 4. 🟢 SEND TO CELERY (staged pipeline: fetch || script -> voice, then compose -> encode -> caption)
     try:
-        # .delay() is the magic function that sends it to Redis
-        process_video_job_task.delay(
-            job_id, 
-            images_list, 
-            product_title, 
-            product_desc, 
-            logo_url, 
-            voice_gender, 
-            duration, 
-            script_tone, 
-            custom_music_path, 
-            video_theme, 
-            shop_name
+        start_render_pipeline(
+            job_id,
+            images_list,
+            product_title,
+            product_desc,
+            logo_url=logo_url,
+            voice_gender=voice_gender,
+            duration=duration,
+            script_tone=script_tone,
+            custom_music_path=custom_music_path,
+            video_theme=video_theme,
+            shop_name=shop_name,
+            regenerate=regenerate,
+            renditions=renditions_list,
+            fingerprint=fingerprint
         )
         logger.info(f"✅ [BACKEND] Job {job_id} sent to Celery!")
     except Exception as e:
         logger.error(f"❌ [BACKEND] Celery failed: {str(e)}")
+        await release_fingerprint_async(fingerprint, job_id)
+        await video_jobs_collection.update_one({"job_id": job_id}, {"$set": {"status": "failed", "error": "Could not connect to Worker."}})
         return {"status": "failed", "error": "Could not connect to Worker."}
     
     return {"status": "queued", "job_id": job_id}
 
 @router.get("/api/check-status/{job_id}")
 async def check_status(job_id: str):
-    job = await video_jobs_collection.find_one({"job_id": job_id})
+    job = await video_jobs_collection.find_one({"job_id": job_id}, STATUS_PROJECTION)
     if not job: return {"status": "not_found"}
     return { 
         "status": job.get("status"), 
         "progress": job.get("progress", 0), 
         "url": job.get("url"), 
-        "error": job.get("error") 
-    }
\ No newline at end of file
+        "error": job.get("error"),
+        "stage": job.get("stage"),
+        "eta_seconds": job.get("eta_seconds")
+    }
+
+@router.post("/api/start-batch-generation")
+async def start_batch_gen(request: BatchRenderRequest):
+    """One request, one batch id, N product renders sharing brand/music/overlay assets."""
+    if not request.products:
+        return {"status": "failed", "error": "No products provided."}
+
+    batch_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    items = []
+    for index, product in enumerate(request.products):
+        item = product.dict()
+        item["job_id"] = str(uuid.uuid4())
+        items.append(item)
+
+    await video_jobs_collection.insert_many([{
+        "job_id": item["job_id"],
+        "batch_id": batch_id,
+        "batch_index": index,
+        "status": "queued",
+        "progress": 0,
+        "created_at": now,
+        "shop_name": request.shop_name,
+        "title": item["product_title"]
+    } for index, item in enumerate(items)])
+    await batch_jobs_collection.insert_one({
+        "batch_id": batch_id,
+        "status": "queued",
+        "shop_name": request.shop_name,
+        "total": len(items),
+        "job_ids": [item["job_id"] for item in items],
+        "created_at": now
+    })
+    logger.info(f"📦 [BACKEND] Batch {batch_id} with {len(items)} products for store: {request.shop_name}")
+
+    settings = request.dict(exclude={"products"})
+    try:
+        process_batch_task.delay(batch_id, items, settings)
+    except Exception as e:
+        logger.error(f"❌ [BACKEND] Celery failed: {str(e)}")
+        return {"status": "failed", "error": "Could not connect to Worker."}
+
+    return {"status": "queued", "batch_id": batch_id, "job_ids": [item["job_id"] for item in items]}
+
+MAX_VARIANTS = 8
+
+@router.post("/api/start-variant-generation")
+async def start_variant_gen(request: VariantRenderRequest):
+    """A/B variants of one product: the visuals are encoded once, each variant only adds an audio mix."""
+    if not request.image_urls: return {"status": "failed", "error": "No images provided."}
+    if not 1 <= len(request.variants) <= MAX_VARIANTS:
+        return {"status": "failed", "error": f"Between 1 and {MAX_VARIANTS} variants are supported."}
+
+    job_id = str(uuid.uuid4())
+    await video_jobs_collection.insert_one({
+        "job_id": job_id,
+        "status": "queued",
+        "progress": 0,
+        "created_at": datetime.utcnow(),
+        "shop_name": request.shop_name,
+        "title": request.product_title,
+        "variant_count": len(request.variants)
+    })
+    variants = [{"gender": v.voice_gender, "script_tone": v.script_tone, "video_theme": v.video_theme} for v in request.variants]
+    try:
+        # Downloads + scripts on the io queue first, then the encode on cpu
+        scripts = [] if request.regenerate else [
+            (request.product_title, request.product_desc, v["script_tone"], request.duration) for v in variants
+        ]
+        (prepare_render_task.si(request.image_urls, request.logo_url, request.renditions, scripts) | process_variant_job_task.si(
+            job_id, request.image_urls, request.product_title, request.product_desc, request.logo_url,
+            request.duration, variants, request.shop_name,
+            template_id=request.template_id, renditions=request.renditions, regenerate=request.regenerate
+        )).apply_async()
+    except Exception as e:
+        logger.error(f"❌ [BACKEND] Celery failed: {str(e)}")
+        return {"status": "failed", "error": "Could not connect to Worker."}
+
+    logger.info(f"🎭 [BACKEND] Variant job {job_id} ({len(variants)} variants) for store: {request.shop_name}")
+    return {"status": "queued", "job_id": job_id}
+
+@router.get("/api/batch-status/{batch_id}")
+async def batch_status(batch_id: str):
+    batch = await batch_jobs_collection.find_one({"batch_id": batch_id}, {"_id": 0, "status": 1, "total": 1})
+    if not batch: return {"status": "not_found"}
+
+    items = []
+    projection = {"_id": 0, "job_id": 1, "title": 1, "status": 1, "progress": 1, "url": 1, "error": 1, "batch_index": 1}
+    async for job in video_jobs_collection.find({"batch_id": batch_id}, projection).sort("batch_index", 1):
+        items.append(job)
+
+    total = batch.get("total") or len(items) or 1
+    counts = {}
+    for job in items: counts[job.get("status")] = counts.get(job.get("status"), 0) + 1
+    finished = counts.get("done", 0) + counts.get("failed", 0)
+    return {
+        "status": batch.get("status"),
+        "progress": round(sum((100 if j.get("status") in ("done", "failed") else j.get("progress", 0)) for j in items) / total),
+        "total": total,
+        "done": counts.get("done", 0),
+        "failed": counts.get("failed", 0),
+        "finished": finished,
+        "items": items
+    }
+
+# --- Live status stream (SSE). /api/check-status stays as the polling fallback. ---
+async def _job_snapshots(job_ids):
+    snapshots = {job_id: {"job_id": job_id, "status": "not_found"} for job_id in job_ids}
+    async for job in video_jobs_collection.find({"job_id": {"$in": list(job_ids)}}, STATUS_PROJECTION):
+        snapshots[job["job_id"]] = status_payload(job["job_id"], job)
+    return snapshots
+
+def _sse_event(payload):
+    return f"event: status\ndata: {json.dumps(payload, default=str)}\n\n"
+
+@router.get("/api/job-events")
+async def job_events(request: Request, job_ids: str = Query(..., description="Comma-separated job ids")):
+    """
+    Server-sent events for one or many jobs: an initial snapshot, then every
+    status/progress change pushed by the workers. Closes once all jobs are
+    finished. If Redis is unavailable it degrades to polling Mongo itself.
+    """
+    ids = [j for j in dict.fromkeys(x.strip() for x in job_ids.split(",")) if j][:SSE_MAX_JOBS]
+
+    async def stream():
+        # Subscribe before the snapshot so nothing published in between is missed
+        queue = job_status_hub.subscribe(ids)
+        last = {}
+        pending = set(ids)
+
+        def changed(payload):
+            job_id = payload["job_id"]
+            if last.get(job_id) == payload: return False
+            last[job_id] = payload
+            if payload.get("status") in TERMINAL_STATUSES: pending.discard(job_id)
+            return True
+
+        try:
+            for payload in (await _job_snapshots(ids)).values():
+                if changed(payload): yield _sse_event(payload)
+
+            while pending:
+                if await request.is_disconnected(): break
+                if not job_status_hub.available:
+                    await asyncio.sleep(SSE_POLL_FALLBACK_SECONDS)
+                    for payload in (await _job_snapshots(pending)).values():
+                        if changed(payload): yield _sse_event(payload)
+                    continue
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Quiet period: keep proxies from closing us and re-sync in case a publish was lost
+                    yield ": keep-alive\n\n"
+                    for payload in (await _job_snapshots(pending)).values():
+                        if changed(payload): yield _sse_event(payload)
+                    continue
+                merged = {**last.get(payload["job_id"], {}), **payload}
+                if changed(merged): yield _sse_event(merged)
+        finally:
+            job_status_hub.unsubscribe(ids, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,22 @@
+import json
+
+from config import SCRIPT_CACHE_TTL_SECONDS
+from media_cache import cache_key
+from redis_client import get_redis
+
+
+def script_cache_key(prompt, model_name, prompt_version):
+    """Keyed on the exact prompt sent to Gemini: only an identical request can reuse a script."""
+    payload = json.dumps({"prompt": prompt, "model": model_name}, sort_keys=True)
+    return f"script:v{prompt_version}:{cache_key(payload)}"
+
+def get_cached_script(key):
+    try: return get_redis().get(key)
+    except Exception as e:
+        print(f"⚠️ Script cache unavailable: {e}")
+        return None
+
+def store_script(key, script):
+    if not script: return
+    try: get_redis().set(key, script, ex=SCRIPT_CACHE_TTL_SECONDS)
+    except Exception as e: print(f"⚠️ Script cache write failed: {e}")
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 🛍️ Async Shopify Admin API access: one pooled client per shop, cursor
+#    pagination, and back-off that follows Shopify's leaky-bucket headers.
+SHOPIFY_API_VERSION = "2024-01"
+PAGE_LIMIT = 250 # Shopify's maximum page size
+MAX_RETRIES = 5
+# Slow down once the bucket (X-Shopify-Shop-Api-Call-Limit: "used/size") is this full
+BUCKET_SLOWDOWN_RATIO = 0.8
+
+_clients = {}
+
+
+class ShopifyAPIError(Exception):
+    def __init__(self, status_code, details):
+        super().__init__(f"Shopify API error {status_code}")
+        self.status_code = status_code
+        self.details = details
+
+
+def get_shop_client(shop):
+    """Keep-alive connections are reused across requests for the same shop."""
+    client = _clients.get(shop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=f"https://{shop}/admin/api/{SHOPIFY_API_VERSION}",
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+            timeout=httpx.Timeout(20.0),
+        )
+        _clients[shop] = client
+    return client
+
+async def close_clients():
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
+
+
+async def _throttle(response):
+    """Sleep a little when the shop's API bucket is close to full."""
+    header = response.headers.get("X-Shopify-Shop-Api-Call-Limit", "")
+    try:
+        used, size = (int(x) for x in header.split("/"))
+    except ValueError:
+        return
+    if size and used / size >= BUCKET_SLOWDOWN_RATIO:
+        # The bucket leaks ~2 calls/s on standard plans
+        await asyncio.sleep((used - size * BUCKET_SLOWDOWN_RATIO + 1) / 2)
+
+async def shopify_request(method, shop, token, url, params=None, json=None):
+    """Request with retries on 429/5xx (honouring Retry-After) and bucket-aware pacing."""
+    client = get_shop_client(shop)
+    headers = {"X-Shopify-Access-Token": token, "Content-Type": "application/json"}
+    for attempt in range(MAX_RETRIES):
+        try:
+            response = await client.request(method, url, params=params, json=json, headers=headers)
+        except httpx.TransportError as e:
+            if attempt == MAX_RETRIES - 1: raise
+            logger.warning(f"Shopify transport error for {shop} ({e}), retrying")
+            await asyncio.sleep(2 ** attempt)
+            continue
+
+        if response.status_code == 429 or response.status_code >= 500:
+            try: delay = float(response.headers.get("Retry-After", ""))
+            except ValueError: delay = 2 ** attempt
+            logger.warning(f"Shopify {response.status_code} for {shop}, backing off {delay}s")
+            await asyncio.sleep(delay)
+            continue
+
+        await _throttle(response)
+        return response
+    return response
+
+async def shopify_get(shop, token, url, params=None):
+    return await shopify_request("GET", shop, token, url, params=params)
+
+async def shopify_post(shop, token, url, payload):
+    return await shopify_request("POST", shop, token, url, json=payload)
+
+async def iter_product_pages(shop, token, params=None):
+    """Yields one list of products per page, following the Link rel="next" cursor."""
+    url = "/products.json"
+    params = {"limit": PAGE_LIMIT, **(params or {})}
+    while url:
+        response = await shopify_get(shop, token, url, params=params)
+        logger.info(f"Shopify Status Code: {response.status_code}")
+        try: data = response.json()
+        except ValueError: data = {"raw": response.text[:500]}
+        if response.status_code != 200:
+            raise ShopifyAPIError(response.status_code, data)
+
+        yield data.get("products", [])
+
+        # The next URL already carries page_info + limit; other filters are not allowed with page_info
+        url = response.links.get("next", {}).get("url")
+        params = None
@@ -4,12 +4,19 @@ import google.generativeai as genai
 from pymongo import MongoClient 
 from datetime import datetime
 from dotenv import load_dotenv
-from celery import Celery  # 🟢 Import Celery
+from celery import Celery, chord, group  # 🟢 Import Celery
+from celery.signals import worker_ready
 
 load_dotenv()
 
 # 🟢 CRITICAL IMPORT: Imports the video generation logic
-from utils import generate_video_from_images 
+from utils import generate_video_from_images, generate_video_variants, generate_script, warm_image_cache, create_template_overlay, resolve_renditions, rendition_filename, RENDITIONS
+from music_library import sync_music_library_async, select_track
+from progress import ProgressReporter
+from job_events import publish_job_status
+from publishing import run_publish_job
+from brand_cache import get_brand_settings
+from indexes import ensure_indexes_sync
 
 # --- 1. CELERY CONFIGURATION (Windows Compatible) ---
 # We define the app here so both the Worker and API can share it
@@ -18,14 +25,51 @@ redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 celery_app = Celery(
     "video_tasks",
     broker=redis_url,
-    backend=redis_url
+    backend=redis_url,
+    include=["pipeline"] # staged render tasks
 )
+# Lets /api/cache-images/{id} tell "queued" from "processing"
+celery_app.conf.task_track_started = True
+# 🚦 Renders (ffmpeg) go to the "cpu" queue, network-bound work to "io";
+#    publishing gets its own queue so uploads never wait behind renders.
+#    The monolithic render tasks (batch items, variants) still download and
+#    call Gemini themselves, so they are queued behind prepare_render_task,
+#    which does that work on "io" and leaves them mostly cache hits.
+#    worker.py has a profile per queue.
+celery_app.conf.task_routes = {
+    "prepare_render_task": {"queue": "io"},
+    "process_video_job_task": {"queue": "cpu"},
+    "process_variant_job_task": {"queue": "cpu"},
+    "render_fetch_stage": {"queue": "io"},
+    "render_script_stage": {"queue": "io"},
+    "render_voice_stage": {"queue": "cpu"},
+    "render_compose_stage": {"queue": "cpu"},
+    "render_encode_stage": {"queue": "cpu"},
+    "render_caption_stage": {"queue": "io"},
+    "prefetch_images_task": {"queue": "io"},
+    "process_batch_task": {"queue": "io"},
+    "finalize_batch_task": {"queue": "io"},
+    "publish_video_task": {"queue": "publish"},
+}
+
+# 🎵 Fetch/transcode the background-music library once per worker node (in the background)
+@worker_ready.connect
+def warm_music_library(**kwargs):
+    sync_music_library_async()
+
+@worker_ready.connect
+def provision_indexes(**kwargs):
+    try: ensure_indexes_sync(db)
+    except Exception as e: print(f"⚠️ Index provisioning failed: {e}")
 
 # --- CONFIGURATION ---
 MONGO_DETAILS = os.getenv("MONGO_DETAILS")
 client = MongoClient(MONGO_DETAILS) 
 db = client.video_ai_db
 video_jobs_collection = db.get_collection("video_jobs")
+batch_jobs_collection = db.get_collection("batch_jobs")
+publish_collection = db.get_collection("publish_jobs")
+social_collection = db.get_collection("social_accounts")
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 BASE_PUBLIC_URL = os.getenv("BASE_PUBLIC_URL", "https://snakiest-edward-autochthonously.ngrok-free.dev")
@@ -43,17 +87,15 @@ def generate_viral_caption(title, desc):
 # --- THE MAIN WORKER FUNCTION ---
 # 🟢 Decorate with @celery_app.task
 @celery_app.task(name="process_video_job_task")
-def process_video_job_task(job_id, image_urls, title, desc, logo_url, voice_gender, duration, script_tone, custom_music_path, video_theme="Modern", shop_name=None):
+def process_video_job_task(job_id, image_urls, title, desc, logo_url, voice_gender, duration, script_tone, custom_music_path, video_theme="Modern", shop_name=None, regenerate=False,
+                           template_id="none", brand_settings=None, bgm_file_path=None, renditions=None):
     print(f"🛠️ Worker Starting Job: {job_id}")
 
-    def update_progress_db(percent):
-        video_jobs_collection.update_one(
-            {"job_id": job_id},
-            {"$set": {"progress": percent, "status": "processing", "updated_at": datetime.utcnow()}}
-        )
+    # 📈 Coalesced, write-behind progress (stage / eta_seconds / encode_stats ride along)
+    update_progress_db = ProgressReporter(video_jobs_collection, job_id, on_flush=publish_job_status)
 
     try:
-        update_progress_db(10)
+        update_progress_db(10, stage="queued")
 
         filename, script_used = generate_video_from_images(
             image_urls=image_urls, 
@@ -66,38 +108,176 @@ def process_video_job_task(job_id, image_urls, title, desc, logo_url, voice_gend
             custom_music_path=custom_music_path, 
             progress_callback=update_progress_db,  
             shop_name=shop_name, 
-            video_theme=video_theme
+            video_theme=video_theme,
+            regenerate=regenerate,
+            template_id=template_id,
+            brand_settings=brand_settings,
+            bgm_file_path=bgm_file_path,
+            renditions=renditions
         )
         
         if filename:
-            update_progress_db(98)
+            update_progress_db(98, stage="caption")
             smart_caption = generate_viral_caption(title, desc)
             video_url = f"{BASE_PUBLIC_URL}/static/{filename}"
+            rendition_urls = {
+                name: f"{BASE_PUBLIC_URL}/static/{rendition_filename(filename, name, k)}"
+                for k, name in enumerate(resolve_renditions(renditions))
+            }
             print(f"✅ Worker Finished: {filename}")
             
-            video_jobs_collection.update_one(
-                {"job_id": job_id},
-                {
-                    "$set": {
-                        "status": "done", 
-                        "progress": 100, 
-                        "url": video_url, 
-                        "filename": filename, 
-                        "caption": smart_caption,
-                        "completed_at": datetime.utcnow()
-                    }
-                }
+            update_progress_db.finish(
+                "done",
+                progress=100, 
+                url=video_url, 
+                filename=filename, 
+                renditions=rendition_urls,
+                caption=smart_caption,
+                completed_at=datetime.utcnow()
             )
         else:
             print(f"❌ Worker Failed: Utils returned None for {job_id}")
-            video_jobs_collection.update_one(
-                {"job_id": job_id},
-                {"$set": {"status": "failed", "error": "Video generation returned no file."}}
-            )
+            update_progress_db.finish("failed", error="Video generation returned no file.")
 
     except Exception as e:
         print(f"❌ Worker CRASH Error: {e}")
-        video_jobs_collection.update_one(
-            {"job_id": job_id},
-            {"$set": {"status": "failed", "error": str(e)}}
-        )
\ No newline at end of file
+        update_progress_db.finish("failed", error=str(e))
+
+# --- VARIANTS (A/B) ---
+# 🎭 One visual encode shared by every voice/tone/music variant of a product
+@celery_app.task(name="process_variant_job_task")
+def process_variant_job_task(job_id, image_urls, title, desc, logo_url, duration, variants, shop_name=None,
+                             template_id="none", renditions=None, regenerate=False):
+    print(f"🎭 Worker Starting Variant Job: {job_id} ({len(variants)} variants)")
+    update_progress_db = ProgressReporter(video_jobs_collection, job_id, on_flush=publish_job_status)
+
+    try:
+        update_progress_db(10, stage="queued")
+        results = generate_video_variants(
+            image_urls, title, desc, variants,
+            logo_url=logo_url,
+            target_duration=duration,
+            progress_callback=update_progress_db,
+            shop_name=shop_name,
+            template_id=template_id,
+            regenerate=regenerate,
+            renditions=renditions
+        )
+        finished = [r for r in (results or []) if r]
+        if not finished:
+            update_progress_db.finish("failed", error="Variant render returned no file.")
+            return
+
+        update_progress_db(98, stage="caption")
+        smart_caption = generate_viral_caption(title, desc)
+        names = resolve_renditions(renditions)
+        variant_docs = [{
+            **result,
+            "url": f"{BASE_PUBLIC_URL}/static/{result['filename']}",
+            "renditions": {name: f"{BASE_PUBLIC_URL}/static/{rendition_filename(result['filename'], name, k)}" for k, name in enumerate(names)},
+        } for result in finished]
+        print(f"✅ Worker Finished Variants: {[v['filename'] for v in variant_docs]}")
+
+        # The first variant doubles as the job's main video so existing clients keep working
+        update_progress_db.finish(
+            "done",
+            progress=100,
+            url=variant_docs[0]["url"],
+            filename=variant_docs[0]["filename"],
+            renditions=variant_docs[0]["renditions"],
+            variants=variant_docs,
+            caption=smart_caption,
+            completed_at=datetime.utcnow()
+        )
+    except Exception as e:
+        print(f"❌ Variant Worker Exception: {e}")
+        update_progress_db.finish("failed", error=str(e))
+
+# 🟢 Cache warm-up: the frontend fires this while the user is still picking options
+@celery_app.task(name="prefetch_images_task")
+def prefetch_images_task(image_urls, logo_url=None, renditions=None):
+    print(f"🗂️ Prefetching {len(image_urls or [])} images...")
+    summary = warm_image_cache(image_urls, logo_url=logo_url, renditions=renditions)
+    print(f"✅ Prefetch Done: {summary['cached']}/{summary['requested']} cached")
+    return summary
+
+# 🌐 IO half of a monolithic render, chained in front of it (see task_routes)
+@celery_app.task(name="prepare_render_task")
+def prepare_render_task(image_urls, logo_url=None, renditions=None, scripts=()):
+    """
+    Warms the image cache and the script cache for a render that follows on
+    the "cpu" queue. Best effort: whatever fails here the render redoes.
+    `scripts` is [(title, desc, script_tone, duration)]; callers leave it
+    empty for `regenerate` renders (the render must call Gemini itself then).
+    """
+    try: warm_image_cache(image_urls, logo_url=logo_url, renditions=renditions)
+    except Exception as e: print(f"⚠️ Render prep (images) failed: {e}")
+    for title, desc, script_tone, duration in scripts:
+        try: generate_script(title, desc, script_tone, duration)
+        except Exception as e: print(f"⚠️ Render prep (script) failed: {e}")
+
+# --- BATCH RENDERS ---
+# 🟢 Shared assets are resolved once here, then every product becomes a normal
+#    process_video_job_task spread over the worker pool (chord -> finalize).
+@celery_app.task(name="process_batch_task")
+def process_batch_task(batch_id, items, settings):
+    print(f"📦 Batch {batch_id}: {len(items)} products")
+    shop_name = settings.get("shop_name")
+    batch_jobs_collection.update_one({"batch_id": batch_id}, {"$set": {"status": "processing", "started_at": datetime.utcnow()}})
+
+    # 1. Brand kit: one lookup for the whole batch ({} = "no settings", so items skip their own lookup)
+    brand = {}
+    if shop_name:
+        try: brand = get_brand_settings(shop_name) or {}
+        except Exception as e: print(f"⚠️ Batch brand lookup failed: {e}")
+
+    # 2. Music + overlay: pick the track once, render the overlays into the shared asset cache
+    track = select_track(settings.get("video_theme"), seed=batch_id)
+    for name in resolve_renditions(settings.get("renditions")):
+        create_template_overlay(settings.get("template_id"), *RENDITIONS[name])
+
+    regenerate = settings.get("regenerate", False)
+    signatures = [
+        prepare_render_task.si(
+            item["image_urls"], item.get("logo_url") or brand.get("logo_url"), settings.get("renditions"),
+            [] if regenerate else [(item["product_title"], item.get("product_desc", ""), settings.get("script_tone", "Professional"), settings.get("duration", 15))],
+        ) | process_video_job_task.si(
+            item["job_id"], item["image_urls"], item["product_title"], item.get("product_desc", ""),
+            item.get("logo_url"), settings.get("voice_gender", "female"), settings.get("duration", 15),
+            settings.get("script_tone", "Professional"), None, settings.get("video_theme", "Modern"),
+            shop_name, regenerate,
+            template_id=settings.get("template_id", "none"),
+            brand_settings=brand,
+            bgm_file_path=track["path"] if track else None,
+            renditions=settings.get("renditions"),
+        )
+        for item in items
+    ]
+    chord(group(signatures))(finalize_batch_task.si(batch_id))
+
+@celery_app.task(name="finalize_batch_task")
+def finalize_batch_task(batch_id):
+    statuses = [j.get("status") for j in video_jobs_collection.find({"batch_id": batch_id}, {"status": 1})]
+    done = statuses.count("done")
+    if done == len(statuses): overall = "done"
+    elif done == 0: overall = "failed"
+    else: overall = "partial_failure"
+    batch_jobs_collection.update_one(
+        {"batch_id": batch_id},
+        {"$set": {"status": overall, "succeeded": done, "failed": len(statuses) - done, "completed_at": datetime.utcnow()}}
+    )
+    print(f"📦 Batch {batch_id} finished: {done}/{len(statuses)} succeeded")
+
+# --- PUBLISHING ---
+PUBLISH_MAX_RETRIES = 5
+PUBLISH_MAX_RETRY_DELAY = 3600 # stay under the Redis visibility timeout
+
+# acks_late: a publish that was running when its worker died is redelivered
+@celery_app.task(name="publish_video_task", bind=True, acks_late=True, max_retries=PUBLISH_MAX_RETRIES)
+def publish_video_task(self, publish_job_id):
+    print(f"🚀 Publishing Job {publish_job_id} (attempt {self.request.retries + 1})")
+    outcome = run_publish_job(publish_job_id, publish_collection, social_collection, final_attempt=self.request.retries >= self.max_retries)
+    if outcome["status"] == "retrying":
+        countdown = outcome.get("retry_in") or 30 * 2 ** self.request.retries
+        raise self.retry(countdown=min(countdown, PUBLISH_MAX_RETRY_DELAY))
+    return outcome
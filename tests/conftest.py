@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+
+# Module-level caches are created at import time: keep them out of the repo's cache/
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="test_cache_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis, self.ops = redis, []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.ops]
+
+
+class FakeRedis:
+    """The few sync Redis commands the code under test uses (no expiry)."""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def decr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) - 1
+        return self.data[key]
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None, get=False):
+        previous = self.data.get(key)
+        if nx and previous is not None: return None
+        self.data[key] = value
+        return previous if get else True
+
+    def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+
+class FakeAsyncRedis(FakeRedis):
+    async def get(self, key):
+        return FakeRedis.get(self, key)
+
+    async def set(self, *args, **kwargs):
+        return FakeRedis.set(self, *args, **kwargs)
+
+    async def delete(self, key):
+        return FakeRedis.delete(self, key)
+
+
+class FakeJobs:
+    """In-memory stand-in for a Motor collection (equality filters only)."""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(d) for d in docs]
+
+    def _match(self, query):
+        return [d for d in self.docs if all(d.get(k) == v for k, v in query.items())]
+
+    async def find_one(self, query, projection=None, sort=None):
+        found = self._match(query)
+        if not found: return None
+        return {k: v for k, v in found[0].items() if k != "_id"}
+
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    async def delete_one(self, query):
+        for d in self._match(query)[:1]: self.docs.remove(d)
+
+    async def update_one(self, query, update):
+        for d in self._match(query)[:1]: d.update(update.get("$set", {}))
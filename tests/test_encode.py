@@ -0,0 +1,64 @@
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+import pytest
+from PIL import Image
+
+import utils
+
+pytestmark = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg is not installed")
+ENCODE_TIMEOUT = 120
+
+
+@pytest.fixture
+def stills(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "VIDEO_DIR", str(tmp_path))
+    paths = []
+    for i, color in enumerate([(200, 0, 0), (0, 200, 0), (0, 0, 200)]):
+        paths.append(str(tmp_path / f"still_{i}.jpg"))
+        Image.new("RGB", (480, 854), color).save(paths[-1])
+    return paths
+
+def run_with_timeout(fn, *args, **kwargs):
+    """A hung ffmpeg fails the test instead of the whole run."""
+    outcome = {}
+    def target():
+        try: outcome["result"] = fn(*args, **kwargs)
+        except Exception as e: outcome["error"] = e
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(ENCODE_TIMEOUT)
+    assert not thread.is_alive(), f"encode still running after {ENCODE_TIMEOUT}s"
+    if "error" in outcome: raise outcome["error"]
+    return outcome["result"]
+
+def duration(path):
+    out = subprocess.run(["ffmpeg", "-hide_banner", "-i", path], stderr=subprocess.PIPE, text=True).stderr
+    h, m, s = re.search(r"Duration: (\d+):(\d+):([\d.]+)", out).groups()
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+@pytest.mark.parametrize("mode", ["files", "stream", "segments"])
+@pytest.mark.parametrize("template_id", ["none", "sale"])
+def test_encode_finishes_at_planned_duration(stills, mode, template_id):
+    final_dur, img_dur = utils.plan_timing(8, 0, len(stills))
+    if mode == "stream": stills = [Image.open(p).convert("RGB") for p in stills]
+    if mode == "segments":
+        run_with_timeout(utils.encode_video_segments, stills, "out.mp4", final_dur, img_dur, ["9x16_480"], template_id=template_id)
+    else:
+        run_with_timeout(utils.encode_video, stills, "out.mp4", final_dur, img_dur, ["9x16_480"],
+                         template_id=template_id, stream=(mode == "stream"))
+
+    output = os.path.join(utils.VIDEO_DIR, utils.rendition_filename("out.mp4", "9x16_480", 0))
+    assert duration(output) == pytest.approx(final_dur, abs=0.1)
+
+def test_video_only_encode_finishes_with_template(stills):
+    final_dur, img_dur = utils.plan_timing(8, 0, len(stills))
+    run_with_timeout(utils.encode_video, stills, "out.mp4", final_dur, img_dur, ["9x16_480"], template_id="sale", audio=False)
+
+    output = os.path.join(utils.VIDEO_DIR, utils.rendition_filename("out.mp4", "9x16_480", 0))
+    assert duration(output) == pytest.approx(final_dur, abs=0.1)
+    assert "Audio:" not in subprocess.run(["ffmpeg", "-hide_banner", "-i", output], stderr=subprocess.PIPE, text=True).stderr
@@ -0,0 +1,62 @@
+import os
+
+import media_cache
+
+
+def make_cache(tmp_path, monkeypatch, max_bytes):
+    monkeypatch.setattr(media_cache, "CACHE_DIR", str(tmp_path))
+    return media_cache.DiskLRUCache("test", max_bytes=max_bytes, min_age=0)
+
+def store(cache, key, size, mtime):
+    tmp = cache.reserve(".bin")
+    with open(tmp, "wb") as f: f.write(b"x" * size)
+    path = cache.commit(key, tmp, ".bin")
+    os.utime(path, (mtime, mtime))
+    cache._track(key, os.path.basename(path), size, mtime)
+    return path
+
+
+def test_evicts_least_recently_used_first(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, monkeypatch, max_bytes=300)
+    store(cache, "a", 100, 1000)
+    store(cache, "b", 100, 2000)
+    store(cache, "c", 100, 3000)
+    store(cache, "d", 100, 4000)
+
+    assert cache.get("a") == (None, None)
+    assert all(cache.get(k)[0] for k in "bcd")
+    assert cache.evictions == 1
+    assert not os.path.exists(os.path.join(cache.root, "a.json"))
+
+def test_hit_protects_entry_from_eviction(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, monkeypatch, max_bytes=300)
+    store(cache, "a", 100, 1000)
+    store(cache, "b", 100, 2000)
+    store(cache, "c", 100, 3000)
+    assert cache.get("a")[0] # now the most recently used
+
+    store(cache, "d", 100, 4000)
+    assert cache.get("b") == (None, None)
+    assert cache.get("a")[0]
+
+def test_byte_total_tracks_overwrites_and_evictions(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, monkeypatch, max_bytes=250)
+    store(cache, "a", 100, 1000)
+    store(cache, "a", 120, 1500) # overwrite, not a second entry
+    store(cache, "b", 100, 2000)
+    assert cache._bytes == 220 and cache.evictions == 0
+
+    store(cache, "c", 100, 3000)
+    assert cache._bytes == 200
+    assert set(cache._index) == {"b", "c"}
+
+def test_recent_entries_are_never_evicted(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, monkeypatch, max_bytes=100)
+    cache.min_age = 3600
+    for key in "abc":
+        tmp = cache.reserve(".bin")
+        with open(tmp, "wb") as f: f.write(b"x" * 100)
+        cache.commit(key, tmp, ".bin")
+
+    assert cache.evictions == 0
+    assert all(cache.get(k)[0] for k in "abc")
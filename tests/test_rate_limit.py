@@ -0,0 +1,43 @@
+import pytest
+
+import rate_limit
+from conftest import FakeRedis
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(rate_limit, "get_redis", lambda: fake)
+    return fake
+
+def counts(redis, key):
+    return [v for k, v in redis.data.items() if k.startswith(f"ratelimit:{key}:")]
+
+
+def test_takes_a_slot_from_every_limit(redis):
+    assert rate_limit.acquire_all([("platform", 5, 60), ("token", 5, 3600)]) == 0
+    assert counts(redis, "platform") == [1]
+    assert counts(redis, "token") == [1]
+
+def test_rejected_token_gives_platform_slot_back(redis):
+    limits = [("platform", 10, 60), ("token", 2, 3600)]
+    assert rate_limit.acquire_all(limits) == 0
+    assert rate_limit.acquire_all(limits) == 0
+
+    wait = rate_limit.acquire_all(limits)
+    assert 0 < wait <= 3600
+    # Neither the platform quota nor the token window grew from the rejected attempt
+    assert counts(redis, "platform") == [2]
+    assert counts(redis, "token") == [2]
+
+def test_retries_do_not_inflate_the_window(redis):
+    limits = [("platform", 1, 60)]
+    assert rate_limit.acquire_all(limits) == 0
+    for _ in range(5): assert rate_limit.acquire_all(limits) > 0
+    assert counts(redis, "platform") == [1]
+
+def test_token_keys_never_contain_the_token():
+    fingerprint = rate_limit.token_fingerprint("EAAB-secret-token")
+    assert "secret" not in fingerprint
+    assert fingerprint == rate_limit.token_fingerprint("EAAB-secret-token")
+    assert fingerprint != rate_limit.token_fingerprint("another-token")
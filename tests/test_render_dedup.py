@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import render_dedup
+import routes.video as video_routes
+from conftest import FakeAsyncRedis, FakeJobs
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeAsyncRedis()
+    monkeypatch.setattr(render_dedup, "get_async_redis", lambda: fake)
+    return fake
+
+def claim(fingerprint, job_id, jobs):
+    return asyncio.run(render_dedup.claim_fingerprint(fingerprint, job_id, jobs))
+
+
+# --- claim_fingerprint ---
+@pytest.mark.parametrize("status", ["queued", "processing", "done"])
+def test_duplicate_gets_the_live_or_finished_job(redis, status):
+    jobs = FakeJobs([{"job_id": "first", "status": status}])
+    assert claim("fp", "first", jobs) is None
+    assert claim("fp", "second", jobs) == "first"
+    assert redis.data[f"{render_dedup.KEY_PREFIX}fp"] == "first"
+
+def test_failed_owner_is_taken_over(redis):
+    jobs = FakeJobs([{"job_id": "first", "status": "failed"}])
+    assert claim("fp", "first", jobs) is None
+    assert claim("fp", "second", jobs) is None
+    assert redis.data[f"{render_dedup.KEY_PREFIX}fp"] == "second"
+
+def test_vanished_owner_is_taken_over(redis):
+    assert claim("fp", "first", FakeJobs()) is None
+    assert claim("fp", "second", FakeJobs()) is None
+
+def test_different_requests_do_not_collide(redis):
+    args = (["https://x/1.jpg"], "Mug", "A mug", None, "female", 15, "Professional", "Modern", "shop", ["9x16_720"])
+    assert render_dedup.request_fingerprint(*args) == render_dedup.request_fingerprint(*args[:1], "  Mug ", *args[2:])
+    assert render_dedup.request_fingerprint(*args) != render_dedup.request_fingerprint(*args[:5], 30, *args[6:])
+
+
+# --- start_gen ---
+@pytest.fixture
+def api(monkeypatch, redis):
+    jobs, started = FakeJobs(), []
+    async def no_brand(collection, shop_name): return {}
+    monkeypatch.setattr(video_routes, "video_jobs_collection", jobs)
+    monkeypatch.setattr(video_routes, "get_brand_settings_async", no_brand)
+    monkeypatch.setattr(video_routes, "start_render_pipeline", lambda job_id, *args, **kwargs: started.append(job_id))
+    app = FastAPI()
+    app.include_router(video_routes.router)
+    return TestClient(app), jobs, started
+
+FORM = {"image_urls": '["https://x/1.jpg"]', "product_title": "Mug", "product_desc": "A mug", "shop_name": "shop"}
+
+def test_duplicate_request_returns_the_running_job(api):
+    client, jobs, started = api
+    first = client.post("/api/start-video-generation", data=FORM).json()
+    assert first["status"] == "queued" and started == [first["job_id"]]
+
+    jobs.docs[0].update({"status": "processing", "progress": 40, "stage": "encode"})
+    second = client.post("/api/start-video-generation", data=FORM).json()
+    assert second == {"job_id": first["job_id"], "status": "processing", "progress": 40, "stage": "encode", "deduplicated": True}
+    assert started == [first["job_id"]]
+    assert [d["job_id"] for d in jobs.docs] == [first["job_id"]] # the duplicate's placeholder is removed
+
+def test_duplicate_of_a_finished_job_gets_its_url(api):
+    client, jobs, started = api
+    first = client.post("/api/start-video-generation", data=FORM).json()
+    jobs.docs[0].update({"status": "done", "progress": 100, "url": "/static/out.mp4"})
+
+    second = client.post("/api/start-video-generation", data=FORM).json()
+    assert second["status"] == "done" and second["url"] == "/static/out.mp4" and second["deduplicated"]
+    assert started == [first["job_id"]]
+
+def test_regenerate_and_failed_jobs_render_again(api):
+    client, jobs, started = api
+    client.post("/api/start-video-generation", data=FORM)
+    client.post("/api/start-video-generation", data={**FORM, "regenerate": "true"})
+    assert len(started) == 2
+
+    for doc in jobs.docs: doc["status"] = "failed"
+    third = client.post("/api/start-video-generation", data=FORM).json()
+    assert third["status"] == "queued" and len(started) == 3
+
+
+# --- renditions form field ---
+@pytest.mark.parametrize("raw, expected", [
+    (None, None),
+    ("", None),
+    ('["9x16_720", "1x1_1080"]', ["9x16_720", "1x1_1080"]),
+    ("9x16_720, 1x1_1080,", ["9x16_720", "1x1_1080"]),
+    ("9x16_720", ["9x16_720"]),
+])
+def test_parse_rendition_names(raw, expected):
+    assert video_routes.parse_rendition_names(raw) == expected
+
+@pytest.mark.parametrize("raw", ['{"9x16_720": 1}', "[1, 2]", '"9x16_720"', "42", "null"])
+def test_parse_rendition_names_rejects_non_lists(raw):
+    with pytest.raises(ValueError):
+        video_routes.parse_rendition_names(raw)
+
+def test_bad_renditions_are_a_400(api):
+    client, jobs, started = api
+    response = client.post("/api/start-video-generation", data={**FORM, "renditions": '{"9x16_720": 1}'})
+    assert response.status_code == 400
+    assert response.json()["status"] == "failed"
+    assert not jobs.docs and not started
@@ -1,6 +1,9 @@
 import os
+import io
+import time
 import requests
 import uuid
+import shutil
 import subprocess
 import google.generativeai as genai
 from PIL import Image, ImageDraw, ImageFont, ImageColor, ImageFilter
@@ -9,11 +12,18 @@ import urllib3
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import platform 
-import asyncio
 import pyttsx3 
 import re
 import textwrap 
-from motor.motor_asyncio import AsyncIOMotorClient
+import threading
+import json
+import functools
+from config import IMAGE_CACHE_FRESH_SECONDS, CACHE_DIR, RENDER_MODE
+from media_cache import image_cache, voice_cache, segment_cache, cache_key, file_digest
+from music_library import select_track, MIX_SAMPLE_RATE
+from ffmpeg_runner import run_ffmpeg
+from script_cache import script_cache_key, get_cached_script, store_script
+from brand_cache import get_brand_settings
 
 # 👇 Disable SSL Warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -24,17 +34,22 @@ VIDEO_DIR = os.path.join(BASE_DIR, "video")
 
 # ⚡ RESOLUTION: 480p (Mobile Vertical)
 WIDTH, HEIGHT = 480, 854 
-BGM_URL = "https://www.bensound.com/bensound-music/bensound-elevate.mp3" 
+
+# 📐 Output ladder. Every job composes ONE 9:16 master; other renditions are
+#    ffmpeg split branches off it (cropped for 1:1 / 4:5, then scaled).
+RENDITIONS = {
+    "9x16_480": (480, 854),
+    "9x16_720": (720, 1280),
+    "9x16_1080": (1080, 1920),
+    "1x1_720": (720, 720),
+    "1x1_1080": (1080, 1080),
+    "4x5_1080": (1080, 1350),
+}
+DEFAULT_RENDITION = "9x16_480"
 
 # Gemini Setup
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-# Database Connection
-MONGO_DETAILS = os.getenv("MONGO_DETAILS") # 🟢 Reads from .env
-client_db = AsyncIOMotorClient(MONGO_DETAILS)
-db = client_db.video_ai_db
-brand_collection = db.get_collection("brand_settings")
-
 # 👇 GPU ACCELERATION CHECK
 def get_ffmpeg_codec():
     system = platform.system()
@@ -47,6 +62,25 @@ def get_ffmpeg_codec():
 
 VIDEO_CODEC = get_ffmpeg_codec()
 
+def resolve_renditions(names=None):
+    """Known rendition names in request order (deduplicated); falls back to the 480p default."""
+    valid = []
+    for name in names or []:
+        if name in RENDITIONS and name not in valid: valid.append(name)
+    return valid or [DEFAULT_RENDITION]
+
+def master_size(renditions):
+    """9:16 canvas wide enough to crop/scale every requested rendition from."""
+    master_w = max(RENDITIONS[name][0] for name in renditions)
+    if master_w == WIDTH: return WIDTH, HEIGHT
+    return master_w, int(round(master_w * 16 / 9 / 2)) * 2
+
+def rendition_filename(output_name, name, index):
+    """The first rendition keeps the plain output name so existing callers see no change."""
+    if index == 0: return output_name
+    root, ext = os.path.splitext(output_name)
+    return f"{root}_{name}{ext}"
+
 def get_audio_duration(file_path):
     if not file_path or not os.path.exists(file_path): return 15.0
     try:
@@ -56,48 +90,98 @@ def get_audio_duration(file_path):
     except: return 15.0
 
 # ⚡ TASK A: AUDIO CHAIN
-def process_audio_chain(title, desc, gender, script_tone, duration):
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        clean_desc = desc.replace('<p>', '').replace('</p>', '').replace('<br>', ' ')
-        target_word_count = int(float(duration) * 2.2) 
-        
-        prompt = (
-            f"Write a spoken video script for product: '{title}'.\n"
-            f"Description: '{clean_desc}'\n"
-            f"Tone: {script_tone}. Duration: {duration}s (~{target_word_count} words).\n"
-            f"Just text. No scene descriptions."
-        )
-        
-        print(f"🤖 [AI] Generating Script...")
-        response = model.generate_content(prompt)
-        clean_script = re.sub(r"(\*\*|Script:|\[.*?\]|\"|Voiceover:)", "", response.text, flags=re.IGNORECASE).strip()
-
-        vo_filename = f"vo_{uuid.uuid4().hex[:8]}.mp3"
-        vo_path = os.path.join(VIDEO_DIR, vo_filename)
-        
+# 👇 Bump whenever the prompt below changes so cached scripts are not reused
+SCRIPT_PROMPT_VERSION = 2
+SCRIPT_MODEL = 'gemini-2.5-flash'
+
+def script_prompt(title, desc, script_tone, duration):
+    clean_desc = desc.replace('<p>', '').replace('</p>', '').replace('<br>', ' ')
+    target_word_count = int(float(duration) * 2.2) 
+    return (
+        f"Write a spoken video script for product: '{title}'.\n"
+        f"Description: '{clean_desc}'\n"
+        f"Tone: {script_tone}. Duration: {duration}s (~{target_word_count} words).\n"
+        f"Just text. No scene descriptions."
+    )
+
+def generate_script(title, desc, script_tone, duration, regenerate=False):
+    """Gemini script for the product, memoized in Redis unless `regenerate` is set."""
+    prompt = script_prompt(title, desc, script_tone, duration)
+    key = script_cache_key(prompt, SCRIPT_MODEL, SCRIPT_PROMPT_VERSION)
+    if not regenerate:
+        cached = get_cached_script(key)
+        if cached:
+            print(f"🤖 [AI] Script cache hit")
+            return cached
+
+    model = genai.GenerativeModel(SCRIPT_MODEL)
+    print(f"🤖 [AI] Generating Script...")
+    response = model.generate_content(prompt)
+    clean_script = re.sub(r"(\*\*|Script:|\[.*?\]|\"|Voiceover:)", "", response.text, flags=re.IGNORECASE).strip()
+    store_script(key, clean_script)
+    return clean_script
+
+# 🗣️ TTS: one pyttsx3 engine per worker process, voices resolved once.
+#    pyttsx3 drivers belong to the thread that created them, so the engine is
+#    created lazily on a dedicated TTS thread and only ever used from there
+#    (which also serializes synthesis: the engine is not thread-safe).
+TTS_RATE = 145
+_tts_engine = None
+_tts_voice_ids = {}
+_tts_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+
+def _init_tts_engine():
+    """This process's TTS engine, created on first use. Only call on the TTS thread."""
+    global _tts_engine
+    if _tts_engine is None:
         engine = pyttsx3.init()
-        engine.setProperty('rate', 145) 
-        
-        voices = engine.getProperty('voices')
-        target_voice = None
-        for voice in voices:
+        engine.setProperty('rate', TTS_RATE)
+        for voice in engine.getProperty('voices'):
             v_name = voice.name.lower()
-            if gender == "female" and ("zira" in v_name or "female" in v_name): target_voice = voice.id; break
-            elif gender == "male" and ("david" in v_name or "male" in v_name): target_voice = voice.id; break
-        
-        if target_voice: engine.setProperty('voice', target_voice)
-        engine.save_to_file(clean_script, vo_path)
-        engine.runAndWait()
-        
-        if not os.path.exists(vo_path) or os.path.getsize(vo_path) == 0:
-            return None, clean_script
-
-        return vo_path, clean_script
+            if "female" not in _tts_voice_ids and ("zira" in v_name or re.search(r"\bfemale\b", v_name)):
+                _tts_voice_ids["female"] = voice.id
+            elif "male" not in _tts_voice_ids and ("david" in v_name or re.search(r"\bmale\b", v_name)) and voice.id != _tts_voice_ids.get("female"):
+                _tts_voice_ids["male"] = voice.id
+        _tts_engine = engine
+        print(f"🗣️ TTS engine ready (voices: {_tts_voice_ids or 'system default'})")
+    return _tts_engine
+
+def _speak_to_file(script, gender, rate, path):
+    engine = _init_tts_engine()
+    engine.setProperty('rate', rate)
+    target_voice = _tts_voice_ids.get(gender)
+    if target_voice: engine.setProperty('voice', target_voice)
+    engine.save_to_file(script, path)
+    engine.runAndWait()
+
+def synthesize_voiceover(script, gender, rate=TTS_RATE):
+    """Returns (path, duration) for the spoken script, from the voiceover cache when possible."""
+    script_hash = cache_key(script)
+    key = cache_key("voice", script_hash, gender, rate)
+    cached_path, meta = voice_cache.get(key)
+    if cached_path: return cached_path, meta.get("duration") or get_audio_duration(cached_path)
+
+    tmp_path = voice_cache.reserve(".mp3")
+    _tts_thread.submit(_speak_to_file, script, gender, rate, tmp_path).result()
+
+    if not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        return None, 0
+
+    duration = get_audio_duration(tmp_path)
+    path = voice_cache.commit(key, tmp_path, ".mp3", {"script_hash": script_hash, "gender": gender, "rate": rate, "duration": duration})
+    return path, duration
+
+def process_audio_chain(title, desc, gender, script_tone, duration, regenerate=False):
+    """Returns (voiceover_path, script, voiceover_duration)."""
+    try:
+        clean_script = generate_script(title, desc, script_tone, duration, regenerate=regenerate)
+        vo_path, vo_duration = synthesize_voiceover(clean_script, gender)
+        return vo_path, clean_script, vo_duration
 
     except Exception as e:
         print(f"❌ Audio Chain Error: {e}")
-        return None, ""
+        return None, "", 0
 
 # ⚡ TASK B: IMAGE PROCESSING
 def create_robust_session():
@@ -107,257 +191,696 @@ def create_robust_session():
     session.mount("https://", adapter)
     return session
 
+def letterbox_image(img, width=WIDTH, height=HEIGHT):
+    """Fits `img` inside width x height on a white canvas (no cropping)."""
+    img = img.convert("RGB")
+    img_ratio = img.width / img.height
+    target_ratio = width / height
+
+    if img_ratio > target_ratio:
+        new_w = width
+        new_h = int(width / img_ratio)
+    else:
+        new_h = height
+        new_w = int(height * img_ratio)
+
+    img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+
+    final_canvas = Image.new("RGB", (width, height), (255, 255, 255))
+    paste_x = (width - new_w) // 2
+    paste_y = (height - new_h) // 2
+    final_canvas.paste(img, (paste_x, paste_y))
+    return final_canvas
+
+def _open_frame(path):
+    with Image.open(path) as img: return img.convert("RGB")
+
+def _store_frame(key, frame, meta):
+    try:
+        tmp_path = image_cache.reserve(".jpg")
+        frame.save(tmp_path, "JPEG", quality=95)
+        image_cache.commit(key, tmp_path, ".jpg", meta)
+    except Exception as e: print(f"⚠️ Image cache write failed: {e}")
+
+# Cache write-back for stream mode runs here, off the render thread
+_cache_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-cache-writer")
+
+LOGO_SIZE = (150, 150) # logos are thumbnailed to this box whatever the canvas
+
+def image_cache_key(url, is_logo, width, height):
+    """Shared by renders and warm_image_cache(): a logo's entry does not depend on the canvas size."""
+    if is_logo: return cache_key("image", "logo", url, *LOGO_SIZE)
+    return cache_key("image", "product", url, width, height)
+
+def fetch_cached_image(url, session, is_logo=False, width=WIDTH, height=HEIGHT, as_frame=False):
+    """
+    Returns a path to the processed (letterboxed / thumbnailed) image for `url`.
+    Served from the persistent image cache when possible; stale entries are
+    revalidated with ETag / Last-Modified so an unchanged image costs a 304.
+
+    With `as_frame` (product images only) the letterboxed RGB PIL image is
+    returned instead: a miss is decoded exactly once in memory and written
+    back to the cache in the background.
+    """
+    as_frame = as_frame and not is_logo
+    key = image_cache_key(url, is_logo, width, height)
+    cached_path, meta = image_cache.get(key, count=False)
+    headers = {"User-Agent": "Mozilla/5.0"}
+
+    if cached_path:
+        if time.time() - meta.get("validated_at", 0) < IMAGE_CACHE_FRESH_SECONDS:
+            image_cache.record_hit()
+            return _open_frame(cached_path) if as_frame else cached_path
+        if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        res = session.get(url, headers=headers, timeout=20, verify=False)
+    except Exception:
+        if cached_path:
+            # CDN unreachable: a stale copy beats a failed render
+            image_cache.record_hit()
+            return _open_frame(cached_path) if as_frame else cached_path
+        raise
+
+    if cached_path and res.status_code == 304:
+        image_cache.record_hit()
+        image_cache.touch(key, validated_at=time.time())
+        return _open_frame(cached_path) if as_frame else cached_path
+
+    image_cache.record_miss()
+    if res.status_code != 200: return None
+
+    # 🟢 CHECK CONTENT TYPE to avoid saving HTML as PNG
+    content_type = res.headers.get("Content-Type", "")
+    if "text/html" in content_type:
+        print(f"⚠️ Warning: URL returned HTML instead of image: {url}")
+        return None
+
+    meta = {
+        "url": url,
+        "etag": res.headers.get("ETag"),
+        "last_modified": res.headers.get("Last-Modified"),
+        "validated_at": time.time(),
+    }
+
+    if as_frame:
+        # ⚡ Single decode: load() both validates the data and gives us the pixels
+        try:
+            with Image.open(io.BytesIO(res.content)) as img:
+                img.load()
+                frame = letterbox_image(img, width, height)
+        except Exception:
+            print(f"❌ Corrupt Image Detected: {url}")
+            return None
+        _cache_writer.submit(_store_frame, key, frame, meta)
+        return frame
+
+    # 🟢 Validate Image Integrity (in memory, nothing hits disk until it is clean)
+    try:
+        with Image.open(io.BytesIO(res.content)) as img:
+            img.verify() # Checks if file is broken
+    except Exception:
+        print(f"❌ Corrupt Image Detected: {url}")
+        return None
+
+    ext = ".png" if is_logo else ".jpg"
+    tmp_path = image_cache.reserve(ext)
+    try:
+        with Image.open(io.BytesIO(res.content)) as img:
+            if is_logo:
+                img.thumbnail(LOGO_SIZE); img.save(tmp_path, "PNG")
+            else:
+                letterbox_image(img, width, height).save(tmp_path, "JPEG", quality=95)
+    except Exception:
+        # Keep the old behaviour: an image PIL cannot resize is still usable by ffmpeg
+        with open(tmp_path, "wb") as f: f.write(res.content)
+
+    return image_cache.commit(key, tmp_path, ext, meta)
+
 def download_and_process_image(args):
-    i, url, is_audio, is_logo, session = args 
+    i, url, is_audio, is_logo, session, *rest = args 
+    as_frame = bool(rest and rest[0])
+    width, height = rest[1] if len(rest) > 1 else (WIDTH, HEIGHT)
     try:
+        if not is_audio:
+            result = fetch_cached_image(url, session, is_logo=is_logo, width=width, height=height, as_frame=as_frame)
+            return (i, result) if result is not None else None
+
         res = session.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=20, verify=False)
         if res.status_code == 200:
-            # 🟢 CHECK CONTENT TYPE to avoid saving HTML as PNG
+            # 🟢 CHECK CONTENT TYPE to avoid saving HTML as MP3
             content_type = res.headers.get("Content-Type", "")
             if "text/html" in content_type:
-                print(f"⚠️ Warning: URL returned HTML instead of image: {url}")
+                print(f"⚠️ Warning: URL returned HTML instead of audio: {url}")
                 return None
 
-            ext = 'mp3' if is_audio else 'png' if is_logo else 'jpg'
-            name = os.path.join(VIDEO_DIR, f"temp_{uuid.uuid4().hex[:8]}.{ext}")
+            name = os.path.join(VIDEO_DIR, f"temp_{uuid.uuid4().hex[:8]}.mp3")
             with open(name, 'wb') as f: f.write(res.content)
-            
-            # 🟢 Validate Image Integrity
-            if not is_audio:
-                try:
-                    with Image.open(name) as img:
-                        img.verify() # Checks if file is broken
-                except Exception:
-                    print(f"❌ Corrupt Image Detected: {url}")
-                    if os.path.exists(name): os.remove(name)
-                    return None
-
-            # Python Resize (Fast)
-            if not is_audio and not is_logo:
-                try:
-                    with Image.open(name) as img:
-                        img = img.convert("RGB")
-                        
-                        img_ratio = img.width / img.height
-                        target_ratio = WIDTH / HEIGHT
-
-                        if img_ratio > target_ratio:
-                            new_w = WIDTH
-                            new_h = int(WIDTH / img_ratio)
-                        else:
-                            new_h = HEIGHT
-                            new_w = int(HEIGHT * img_ratio)
-
-                        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-
-                        final_canvas = Image.new("RGB", (WIDTH, HEIGHT), (255, 255, 255))
-                        paste_x = (WIDTH - new_w) // 2
-                        paste_y = (HEIGHT - new_h) // 2
-                        final_canvas.paste(img, (paste_x, paste_y))
-                        
-                        final_canvas.save(name, "JPEG", quality=95)
-                except: pass
-            
-            if is_logo:
-                try:
-                    with Image.open(name) as img:
-                        img.thumbnail((150, 150)); img.save(name, "PNG")
-                except: pass
             return (i, name)
     except: return None
 
-# --- TEMPLATE OVERLAY (Fixed to safely handle 'none') ---
-def create_template_overlay(template_id, output_path):
-    # 🟢 STRICT CHECK: If ID is 'none', 'null', or empty, return None immediately.
-    if not template_id or str(template_id).lower() in ["none", "null", ""]: 
-        return None
-    
-    try:
-        overlay = Image.new("RGBA", (WIDTH, HEIGHT), (0,0,0,0))
-        draw = ImageDraw.Draw(overlay)
-        try: font = ImageFont.truetype("arial.ttf", 50)
-        except: font = ImageFont.load_default()
+def warm_image_cache(image_urls, logo_url=None, renditions=None):
+    """
+    Pre-fetches images through the same pipeline as a render (download, validate,
+    letterbox) so the fetch stage of the next job is a pure cache hit.
+    """
+    size = master_size(resolve_renditions(renditions))
+    tasks = [(i, url, False, False, False, size) for i, url in enumerate(image_urls or []) if url]
+    if logo_url: tasks.append((100, logo_url, False, True, False, size))
+    if not tasks: return {"requested": 0, "cached": 0, "failed": []}
+
+    failed = []
+    session = create_robust_session()
+    with ThreadPoolExecutor(max_workers=8) as exec:
+        futures = {exec.submit(download_and_process_image, (*t[:4], session, *t[4:])): t[1] for t in tasks}
+        for future in as_completed(futures):
+            if not future.result(): failed.append(futures[future])
+    session.close()
 
-        color_map = { "sale": "#e11d48", "winter": "#0891b2", "luxury": "#d4af37", "kids": "#ff5733" }
-        text_map = { "sale": "FLASH SALE", "winter": "WINTER SPECIAL", "luxury": "PREMIUM", "kids": "KIDS ZONE" }
+    return {
+        "requested": len(tasks),
+        "cached": len(tasks) - len(failed),
+        "failed": failed,
+    }
+
+# --- TEMPLATE ASSETS (rendered once per process, persisted in CACHE_DIR) ---
+# 👇 Editing a spec changes its version hash, which invalidates the cached overlay.
+#    Bump TEMPLATE_RENDER_VERSION when the drawing code itself changes.
+TEMPLATE_RENDER_VERSION = 1
+TEMPLATE_SPECS = {
+    "sale": {"color": "#e11d48", "text": "FLASH SALE"},
+    "winter": {"color": "#0891b2", "text": "WINTER SPECIAL"},
+    "luxury": {"color": "#d4af37", "text": "PREMIUM"},
+    "kids": {"color": "#ff5733", "text": "KIDS ZONE"},
+}
+OVERLAY_DIR = os.path.join(CACHE_DIR, "overlays")
+os.makedirs(OVERLAY_DIR, exist_ok=True)
+_overlay_cache = {}
+_overlay_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=32)
+def get_font(size):
+    """arial.ttf is looked up once per size instead of on every frame we draw."""
+    try: return ImageFont.truetype("arial.ttf", size)
+    except: return ImageFont.load_default()
+
+def template_version(template_id):
+    spec = TEMPLATE_SPECS[template_id]
+    return cache_key(TEMPLATE_RENDER_VERSION, json.dumps(spec, sort_keys=True))[:12]
+
+def _draw_template_overlay(template_id, width, height, output_path):
+    spec = TEMPLATE_SPECS[template_id]
+    s = width / 480 # all sizes were designed for the 480px-wide canvas
+    overlay = Image.new("RGBA", (width, height), (0,0,0,0))
+    draw = ImageDraw.Draw(overlay)
+    color = spec["color"]
+
+    draw.rectangle([0, 0, width, height], outline=color, width=int(20 * s))
+    draw.rectangle([0, 0, width, int(80 * s)], fill=color)
+    draw.text((width//2, int(40 * s)), spec["text"], font=get_font(int(50 * s)), fill="white", anchor="mm")
+    draw.rectangle([0, height - int(60 * s), width, height], fill=color)
+    overlay.save(output_path, "PNG")
 
-        color = color_map.get(template_id, "#000000")
-        text = text_map.get(template_id, "")
+# --- TEMPLATE OVERLAY (Fixed to safely handle 'none') ---
+def create_template_overlay(template_id, width=WIDTH, height=HEIGHT):
+    """Path to the cached overlay PNG for (template, resolution). Never delete it."""
+    # 🟢 STRICT CHECK: only known templates ('none', typos, '../x'... get no overlay).
+    #    The id ends up in a file name, so nothing else may get past here.
+    if template_id not in TEMPLATE_SPECS:
+        return None
 
-        draw.rectangle([0, 0, WIDTH, HEIGHT], outline=color, width=20)
-        draw.rectangle([0, 0, WIDTH, 80], fill=color)
-        draw.text((WIDTH//2, 40), text, font=font, fill="white", anchor="mm")
-        draw.rectangle([0, HEIGHT-60, WIDTH, HEIGHT], fill=color)
+    entry = (template_id, width, height, template_version(template_id))
+    path = _overlay_cache.get(entry)
+    if path and os.path.exists(path): return path
 
-        overlay.save(output_path, "PNG")
-        return output_path
+    try:
+        with _overlay_lock:
+            path = os.path.join(OVERLAY_DIR, f"overlay_{template_id}_{width}x{height}_{entry[3]}.png")
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+                _draw_template_overlay(template_id, width, height, tmp_path)
+                os.replace(tmp_path, path)
+            _overlay_cache[entry] = path
+        return path
     except: return None
 
-def create_outro_image(last_image_path, text, output_path, cta_text="ORDER NOW", brand_color="#FFD700"):
+@functools.lru_cache(maxsize=8)
+def _outro_scrim(width, height):
+    return Image.new("RGBA", (width, height), (0, 0, 0, 150))
+
+def render_outro_frame(last_image, text, cta_text="ORDER NOW", brand_color="#FFD700", width=WIDTH, height=HEIGHT):
+    """
+    Outro still as a PIL image. Only the product-dependent parts (blurred
+    background + text) are computed here; scrim and fonts come from caches.
+    """
+    s = width / 480
+    if last_image is not None:
+        base = last_image.convert("RGB").resize((width, height)).filter(ImageFilter.GaussianBlur(15 * s))
+    else:
+        base = Image.new("RGB", (width, height), (20, 20, 20))
+
+    scrim = _outro_scrim(width, height)
+    base.paste(scrim, (0, 0), scrim)
+    draw = ImageDraw.Draw(base)
+    font = get_font(int(36 * s))
+
+    lines = textwrap.wrap(text, width=25)
+    y = height // 2 - int(len(lines) * 20 * s)
+    for line in lines:
+        draw.text((width//2, y), line, font=font, fill="white", anchor="mm")
+        y += int(40 * s)
+    
+    draw.text((width//2, y + int(40 * s)), cta_text, font=font, fill=brand_color, anchor="mm")
+    return base
+
+def create_outro_image(last_image_path, text, output_path, cta_text="ORDER NOW", brand_color="#FFD700", width=WIDTH, height=HEIGHT):
     try:
-        if last_image_path and os.path.exists(last_image_path):
-            base = Image.open(last_image_path).convert("RGB").filter(ImageFilter.GaussianBlur(15))
-        else:
-            base = Image.new("RGB", (WIDTH, HEIGHT), (20, 20, 20))
-
-        base = base.resize((WIDTH, HEIGHT))
-        overlay = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 150))
-        base.paste(overlay, (0, 0), overlay)
-        draw = ImageDraw.Draw(base)
-        
-        try: font = ImageFont.truetype("arial.ttf", 36)
-        except: font = ImageFont.load_default()
-
-        lines = textwrap.wrap(text, width=25)
-        y = HEIGHT // 2 - (len(lines) * 20)
-        for line in lines:
-            draw.text((WIDTH//2, y), line, font=font, fill="white", anchor="mm")
-            y += 40
-        
-        draw.text((WIDTH//2, y+40), cta_text, font=font, fill=brand_color, anchor="mm")
-        base.save(output_path)
+        last_image = Image.open(last_image_path) if last_image_path and os.path.exists(last_image_path) else None
+        render_outro_frame(last_image, text, cta_text, brand_color, width, height).save(output_path)
         return output_path
     except: return None
 
-async def fetch_brand_settings(shop_name):
-    if not shop_name: return None
-    try: return await brand_collection.find_one({"shop": shop_name})
-    except: return None
-
-# 🚀 MAIN FUNCTION (Robust & Crash Proof)
-def generate_video_from_images(image_urls, product_title, product_desc, logo_url=None, gender="female", 
-                               target_duration=15, script_tone="Professional", custom_music_path=None, 
-                               progress_callback=None, shop_name=None, video_theme="Modern", 
-                               bgm_file_path=None, template_id="none"):
-    
-    if not os.path.exists(VIDEO_DIR): os.makedirs(VIDEO_DIR)
-    if progress_callback: progress_callback(5)
-
-    # 1. Fetch Brand Kit
-    brand_color = "#FFD700"
-    cta_text = "ORDER NOW"
-    if shop_name:
+# 🧩 RENDER STAGES
+# generate_video_from_images() runs these back to back in one process;
+# pipeline.py runs them as separate Celery tasks with artifacts on disk in between.
+DEFAULT_BRAND = {"brand_color": "#FFD700", "cta_text": "ORDER NOW"}
+OUTRO_SECONDS = 3.0
+# Every video encode uses exactly these settings (segments must match to be stream-copied together)
+X264_ARGS = ['-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency', '-pix_fmt', 'yuv420p']
+SEGMENT_FPS = 25
+SEGMENT_CACHE_VERSION = 1 # bump when encode_segment() output changes
+
+def render_cpus():
+    """Cores one render may use: worker.py sets RENDER_CPUS to cores // concurrency, so parallel renders don't oversubscribe."""
+    return int(os.getenv("RENDER_CPUS", "0")) or (os.cpu_count() or 1)
+
+def segment_workers():
+    """ffmpeg processes per render in "segments" mode (SEGMENT_WORKERS, else one per core of the render's share)."""
+    return int(os.getenv("SEGMENT_WORKERS", "0")) or render_cpus()
+
+def resolve_brand(shop_name=None, brand_settings=None, logo_url=None):
+    """Brand colour / CTA / logo for a render; an explicit logo_url wins over the brand kit's."""
+    brand = {**DEFAULT_BRAND, "logo_url": logo_url}
+    if shop_name or brand_settings:
         try:
-            settings = asyncio.run(fetch_brand_settings(shop_name))
+            settings = brand_settings if brand_settings is not None else get_brand_settings(shop_name)
             if settings:
-                if settings.get("primary_color"): brand_color = settings["primary_color"]
-                if settings.get("cta_text"): cta_text = settings["cta_text"]
-                if settings.get("logo_url") and not logo_url: logo_url = settings["logo_url"]
-        except: pass
-
-    downloaded_images = []
-    bgm_file, vo_file, logo_file = None, None, None
-    script_text = ""
-
-    if custom_music_path and os.path.exists(custom_music_path):
-        bgm_file = custom_music_path
-
-    # Parallel Download
+                if settings.get("primary_color"): brand["brand_color"] = settings["primary_color"]
+                if settings.get("cta_text"): brand["cta_text"] = settings["cta_text"]
+                if settings.get("logo_url") and not logo_url: brand["logo_url"] = settings["logo_url"]
+        except Exception as e: print(f"⚠️ Brand kit lookup failed: {e}")
+    return brand
+
+def resolve_music(video_theme, seed, custom_music_path=None, bgm_file_path=None):
+    """(path, gain) of the music bed: the upload, a caller-owned file, or the theme's library track."""
+    if custom_music_path and os.path.exists(custom_music_path): return custom_music_path, 1.0
+    if bgm_file_path and os.path.exists(bgm_file_path): return bgm_file_path, 1.0
+    # 🎵 Local library track for the theme (zero network I/O here)
+    track = select_track(video_theme, seed=seed)
+    if track: return track["path"], track["gain"]
+    print("⚠️ Music library not synced yet, rendering without background music")
+    return None, 1.0
+
+def fetch_images(image_urls, logo_url=None, size=(WIDTH, HEIGHT), as_frame=False):
+    """Parallel download. Returns ([(index, path or PIL frame)] in order, logo_path)."""
+    images, logo_file = [], None
     session = create_robust_session()
-    with ThreadPoolExecutor(max_workers=8) as exec:
-        future_audio = exec.submit(process_audio_chain, product_title, product_desc, gender, script_tone, target_duration)
-        tasks = [(i, url, False, False, session) for i, url in enumerate(image_urls)]
-        if not bgm_file: tasks.append((99, BGM_URL, True, False, session))
-        if logo_url: tasks.append((100, logo_url, False, True, session))
-        
-        for future in as_completed([exec.submit(download_and_process_image, t) for t in tasks]):
-            res = future.result()
-            if res:
-                if res[0] == 99: bgm_file = res[1]
-                elif res[0] == 100: logo_file = res[1]
-                else: downloaded_images.append(res)
-        vo_file, script_text = future_audio.result()
-    session.close()
-
-    if not downloaded_images: return None, "No Images"
-    downloaded_images.sort()
-
     try:
-        # Generate Extras
-        last_img = downloaded_images[-1][1]
-        outro_path = os.path.join(VIDEO_DIR, f"outro_{uuid.uuid4().hex[:6]}.jpg")
-        create_outro_image(last_img, product_title, outro_path, cta_text=cta_text, brand_color=brand_color)
-        if os.path.exists(outro_path): downloaded_images.append((999, outro_path))
-
-        overlay_path = os.path.join(VIDEO_DIR, f"overlay_{uuid.uuid4().hex[:6]}.png")
-        generated_overlay = create_template_overlay(template_id, overlay_path)
-
-        # Durations
-        audio_dur = get_audio_duration(vo_file) if vo_file else 0
-        final_dur = max(5.0, min(float(target_duration), audio_dur if audio_dur > 0 else float(target_duration)))
-        
-        num_images = len(downloaded_images)
-        img_dur = (final_dur - 3.0) / max(1, num_images - 1)
+        with ThreadPoolExecutor(max_workers=8) as exec:
+            tasks = [(i, url, False, False, session, as_frame, size) for i, url in enumerate(image_urls)]
+            if logo_url: tasks.append((100, logo_url, False, True, session))
+            for future in as_completed([exec.submit(download_and_process_image, t) for t in tasks]):
+                res = future.result()
+                if not res: continue
+                if res[0] == 100: logo_file = res[1]
+                else: images.append(res)
+    finally:
+        session.close()
+    print(f"🗂️ Image cache: {image_cache.hits} hits / {image_cache.misses} misses (process lifetime)")
+    images.sort(key=lambda r: r[0])
+    return images, logo_file
+
+def plan_timing(target_duration, vo_duration, num_segments):
+    """(final_duration, seconds per still). The last segment (the outro) holds OUTRO_SECONDS."""
+    final_dur = max(5.0, min(float(target_duration), vo_duration if vo_duration > 0 else float(target_duration)))
+    img_dur = (final_dur - OUTRO_SECONDS) / max(1, num_segments - 1)
+    return final_dur, img_dur
+
+def _branch_filters(node, tag, width, height, master_w, master_h, overlay_node=None, logo_node=None):
+    """One rendition's branch: crop/scale from the master canvas, then template overlay and logo. Returns (filters, out_node)."""
+    filters = ""
+    if (width, height) != (master_w, master_h):
+        crop_h = min(master_h, int(round(master_w * height / width / 2)) * 2)
+        filters += f"{node}crop={master_w}:{crop_h},scale={width}:{height},setsar=1[r{tag}];"
+        node = f"[r{tag}]"
+    if overlay_node:
+        filters += f"{node}{overlay_node}overlay=0:0[v_over{tag}];"
+        node = f"[v_over{tag}]"
+    if logo_node:
+        scale = width / WIDTH
+        if scale != 1:
+            filters += f"{logo_node}scale=iw*{scale:.3f}:-1[lgs{tag}];"
+            logo_node = f"[lgs{tag}]"
+        filters += f"{node}{logo_node}overlay=W-w-{int(20 * scale)}:{int(40 * scale)}[v_final{tag}];"
+        node = f"[v_final{tag}]"
+    return filters, node
+
+def _audio_graph(first_idx, bgm_file, vo_file, bgm_gain, n_out):
+    """Music bed (or silence) ducked under the voiceover, split per output. Returns (input_args, filters, audio_nodes)."""
+    input_args = []
+    if bgm_file and os.path.exists(bgm_file):
+        input_args.extend(["-stream_loop", "-1", "-i", bgm_file])
+    else:
+        input_args.extend(["-f", "lavfi", "-i", f"anullsrc=r={MIX_SAMPLE_RATE}:cl=stereo"])
+    bgm_idx = first_idx
+
+    if vo_file and os.path.exists(vo_file):
+        input_args.extend(["-i", vo_file])
+        vo_idx = first_idx + 1
+        filters = f"[{bgm_idx}:a]volume={0.2 * bgm_gain:.3f}[bg];[{vo_idx}:a]volume=2.0[vo];[bg][vo]amix=inputs=2:duration=first[a_out]"
+    else:
+        filters = f"[{bgm_idx}:a]volume={0.5 * bgm_gain:.3f}[a_out]"
+
+    audio_nodes = ["[a_out]"]
+    if n_out > 1:
+        filters += f";[a_out]asplit={n_out}" + "".join(f"[a{k}]" for k in range(n_out))
+        audio_nodes = [f"[a{k}]" for k in range(n_out)]
+    return input_args, filters, audio_nodes
+
+def encode_video(stills, output_name, final_dur, img_dur, renditions, template_id="none", logo_file=None,
+                 vo_file=None, bgm_file=None, bgm_gain=1.0, stream=False, progress_callback=None, audio=True):
+    """
+    One ffmpeg run for the whole timeline and every rendition.
+    `stills` are image paths (files mode) or PIL frames (stream mode), outro last.
+    `audio=False` writes video-only outputs (variants mux their audio on later).
+    Returns run_ffmpeg()'s stats; raises on failure.
+    """
+    master_w, master_h = master_size(renditions)
+    num_images = len(stills)
+
+    # 🟢 CRITICAL FIX: UNIFORM SCALING FOR ALL INPUTS
+    input_args = []
+    filter_complex = ""
+    concat_v = ""
+    current_idx = 0
+
+    if stream:
+        # ⚡ One raw RGB frame per segment on stdin. Frame k is stamped at k*img_dur,
+        # fps=25 repeats it until the next one and tpad holds the outro. The last
+        # piped frame already lasts one input frame before tpad starts, so trim
+        # cuts the timeline back to final_dur (the outro then holds OUTRO_SECONDS, as in files mode).
+        input_args.extend(["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{master_w}x{master_h}", "-framerate", "1", "-i", "pipe:0"])
+        if num_images > 1:
+            timing = f"settb=AVTB,setpts=N*{img_dur:.4f}/TB,fps=25,tpad=stop_mode=clone:stop_duration={OUTRO_SECONDS:g}"
+        else:
+            timing = f"fps=25,tpad=stop_mode=clone:stop_duration={OUTRO_SECONDS:g}"
+        timing += f",trim=duration={final_dur:.3f}"
+        filter_complex += f"[0:v]{timing},setsar=1[base];"
+        current_idx += 1
+    else:
+        for i, path in enumerate(stills):
+            input_args.extend(["-loop", "1", "-t", str(OUTRO_SECONDS if i==num_images-1 else img_dur), "-i", path])
+
+            # 👇 FORCE every image onto the master canvas.
+            filter_complex += f"[{current_idx}:v]scale={master_w}:{master_h},setsar=1[v{current_idx}];"
 
-        output_name = f"vid_{uuid.uuid4().hex[:6]}.mp4"
-        output_path = os.path.join(VIDEO_DIR, output_name)
-        
-        # 🟢 CRITICAL FIX: UNIFORM SCALING FOR ALL INPUTS
-        input_args = []
-        filter_complex = ""
-        concat_v = ""
-        current_idx = 0
-        
-        for i, item in enumerate(downloaded_images):
-            input_args.extend(["-loop", "1", "-t", str(3.0 if i==num_images-1 else img_dur), "-i", item[1]])
-            
-            # 👇 FORCE scale=480:854 for EVERY image.
-            filter_complex += f"[{current_idx}:v]scale=480:854,setsar=1[v{current_idx}];"
-            
             concat_v += f"[v{current_idx}]"
             current_idx += 1
-        
+
         filter_complex += f"{concat_v}concat=n={num_images}:v=1:a=0[base];"
-        last_node = "[base]"
 
-        # 2. Overlay
+    # 2. Rendition ladder: one split branch per output
+    n_out = len(renditions)
+    if n_out > 1:
+        filter_complex += "[base]split=" + str(n_out) + "".join(f"[b{k}]" for k in range(n_out)) + ";"
+
+    # 3. Logo (one input, split across renditions)
+    logo_nodes = []
+    if logo_file and os.path.exists(logo_file):
+        input_args.extend(["-i", logo_file])
+        if n_out > 1:
+            filter_complex += f"[{current_idx}:v]split={n_out}" + "".join(f"[lg{k}]" for k in range(n_out)) + ";"
+            logo_nodes = [f"[lg{k}]" for k in range(n_out)]
+        else:
+            logo_nodes = [f"[{current_idx}:v]"]
+        current_idx += 1
+
+    # 4. Per-rendition branch: crop/scale from the master, then template overlay + logo
+    video_nodes = []
+    for k, name in enumerate(renditions):
+        w, h = RENDITIONS[name]
+        overlay_node = None
+        generated_overlay = create_template_overlay(template_id, w, h)
         if generated_overlay and os.path.exists(generated_overlay):
-            input_args.extend(["-loop", "1", "-i", generated_overlay])
-            filter_complex += f"{last_node}[{current_idx}:v]overlay=0:0[v_over];"
-            last_node = "[v_over]"
+            # Single still, no -loop: overlay repeats its last frame and ends with the video
+            input_args.extend(["-i", generated_overlay])
+            overlay_node = f"[{current_idx}:v]"
             current_idx += 1
 
-        # 3. Logo
-        if logo_file and os.path.exists(logo_file):
-            input_args.extend(["-i", logo_file])
-            filter_complex += f"{last_node}[{current_idx}:v]overlay=W-w-20:40[v_final];"
-            last_node = "[v_final]"
-            current_idx += 1
+        branch, node = _branch_filters(f"[b{k}]" if n_out > 1 else "[base]", k, w, h, master_w, master_h, overlay_node, logo_nodes[k] if logo_nodes else None)
+        filter_complex += branch
+        video_nodes.append(node)
+
+    # 5. Audio
+    if audio:
+        audio_inputs, audio_filter, audio_nodes = _audio_graph(current_idx, bgm_file, vo_file, bgm_gain, n_out)
+        input_args.extend(audio_inputs)
+        filter_complex += audio_filter
+    else:
+        filter_complex = filter_complex.rstrip(";")
+
+    # 👇 ULTRAFAST COMMAND, one output per rendition (progress pipe is drained on a thread = NO STUCK)
+    #    The music bed loops forever, so -t is what guarantees every output ends.
+    output_args = []
+    for k, name in enumerate(renditions):
+        audio_args = ['-map', audio_nodes[k], '-c:a', 'aac', '-ar', str(MIX_SAMPLE_RATE)] if audio else ['-an']
+        output_args += [
+            '-map', video_nodes[k], *audio_args,
+            *X264_ARGS,
+            '-t', f'{final_dur:.3f}', '-shortest', os.path.join(VIDEO_DIR, rendition_filename(output_name, name, k))
+        ]
+    cmd = ['ffmpeg', '-y', *input_args, '-filter_complex', filter_complex, *output_args]
+
+    if progress_callback: progress_callback(70, stage="encode")
+    print("🎬 Running FFmpeg (Fast Mode)...")
+
+    def on_encode_progress(fraction, eta, speed):
+        # Encode owns the 70 -> 95 band of the job's progress bar
+        if progress_callback:
+            progress_callback(70 + int(25 * fraction), stage="encode", eta_seconds=round(eta, 1) if eta is not None else None)
+
+    stdin_frames = None
+    if stream:
+        # rawvideo needs exact dims
+        stdin_frames = (
+            (frame if frame.size == (master_w, master_h) else letterbox_image(frame, master_w, master_h)).tobytes()
+            for frame in stills
+        )
+    encode_stats = run_ffmpeg(cmd, final_dur, on_progress=on_encode_progress, stdin_frames=stdin_frames)
+    print(f"🎬 Encode took {encode_stats['wall_seconds']}s ({encode_stats['speed']}x realtime)")
+    return encode_stats
+
+def segment_frame_counts(num_stills, img_dur):
+    """Frames per still on the SEGMENT_FPS grid (cumulative rounding, so the parts add up to the timeline)."""
+    durations = [img_dur] * (num_stills - 1) + [OUTRO_SECONDS]
+    bounds, elapsed = [0], 0.0
+    for duration in durations:
+        elapsed += duration
+        bounds.append(int(round(elapsed * SEGMENT_FPS)))
+    return [max(1, end - start) for start, end in zip(bounds, bounds[1:])]
+
+def encode_segment(still, frames, output_path, width, height, master_w, master_h, overlay=None, logo_file=None, threads=1):
+    """Encodes one still as a silent H.264 clip of `frames` frames, overlay and logo burned in."""
+    input_args = ['-loop', '1', '-framerate', str(SEGMENT_FPS), '-i', still]
+    overlay_node = logo_node = None
+    if overlay and os.path.exists(overlay):
+        input_args.extend(['-loop', '1', '-i', overlay])
+        overlay_node = "[1:v]"
+    if logo_file and os.path.exists(logo_file):
+        input_args.extend(['-i', logo_file])
+        logo_node = f"[{1 + bool(overlay_node)}:v]"
+
+    branch, node = _branch_filters("[seg]", 0, width, height, master_w, master_h, overlay_node, logo_node)
+    filter_complex = (f"[0:v]scale={master_w}:{master_h},setsar=1[seg];" + branch).rstrip(";")
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error', *input_args, '-filter_complex', filter_complex, '-map', node,
+        '-frames:v', str(frames), '-r', str(SEGMENT_FPS), *X264_ARGS, '-threads', str(threads), '-an', output_path
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return output_path
+
+def segment_cache_key(still, frames, width, height, master_w, master_h, template_id=None, overlay=None, logo_file=None):
+    """Everything that changes an encoded segment's pixels or bitstream."""
+    return cache_key(
+        "segment", SEGMENT_CACHE_VERSION, file_digest(still), frames, width, height, master_w, master_h,
+        template_version(template_id) if overlay else "no-overlay",
+        file_digest(logo_file) if logo_file and os.path.exists(logo_file) else "no-logo",
+        SEGMENT_FPS, *X264_ARGS,
+    )
+
+def cached_segment(still, frames, width, height, master_w, master_h, template_id=None, overlay=None, logo_file=None, threads=1):
+    """Returns (path, was_cached). Misses are encoded straight into the segment cache."""
+    key = segment_cache_key(still, frames, width, height, master_w, master_h, template_id, overlay, logo_file)
+    path, _ = segment_cache.get(key)
+    if path: return path, True
+    tmp_path = segment_cache.reserve(".mp4")
+    try:
+        encode_segment(still, frames, tmp_path, width, height, master_w, master_h, overlay, logo_file, threads)
+    except Exception:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+    return segment_cache.commit(key, tmp_path, ".mp4", {"frames": frames, "size": [width, height]}), False
+
+def encode_video_segments(stills, output_name, final_dur, img_dur, renditions, template_id="none", logo_file=None,
+                          vo_file=None, bgm_file=None, bgm_gain=1.0, progress_callback=None, workers=None, audio=True):
+    """
+    render_mode "segments": every (still, rendition) pair is encoded as its own
+    clip, segment_workers() ffmpeg processes at a time, with identical encoder
+    settings. Each rendition is then joined with the concat demuxer in
+    stream-copy mode while the audio is mixed in (the only non-parallel step,
+    and it never re-encodes video). Same arguments and stats as encode_video().
+
+    Clips come from segment_cache, so a re-render that only changes the voice,
+    tone or music encodes nothing but the segments that actually changed.
+    """
+    master_w, master_h = master_size(renditions)
+    workers = max(1, workers or segment_workers())
+    threads = max(1, render_cpus() // workers)
+    frame_counts = segment_frame_counts(len(stills), img_dur)
+    work_dir = os.path.join(VIDEO_DIR, f"seg_{uuid.uuid4().hex[:8]}")
+    os.makedirs(work_dir, exist_ok=True)
+    started = time.monotonic()
 
-        # 4. Audio
-        bgm_in = bgm_file if (bgm_file and os.path.exists(bgm_file)) else "anullsrc"
-        input_args.extend(["-stream_loop", "-1", "-i", bgm_in])
-        bgm_idx = current_idx
-        current_idx += 1
-        
-        audio_map = ""
-        if vo_file and os.path.exists(vo_file):
-            input_args.extend(["-i", vo_file])
-            vo_idx = current_idx
-            filter_complex += f"[{bgm_idx}:a]volume=0.2[bg];[{vo_idx}:a]volume=2.0[vo];[bg][vo]amix=inputs=2:duration=first[a_out]"
-            audio_map = "[a_out]"
+    try:
+        # 1. Parallel segment encodes (each job is an ffmpeg process, threads only wait on them)
+        if progress_callback: progress_callback(70, stage="encode")
+        print(f"🎬 Preparing {len(stills) * len(renditions)} segments on {workers} workers...")
+        segments = {} # rendition index -> ordered clip paths
+        reused = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for k, name in enumerate(renditions):
+                w, h = RENDITIONS[name]
+                overlay = create_template_overlay(template_id, w, h)
+                segments[k] = [None] * len(stills)
+                for i, still in enumerate(stills):
+                    future = pool.submit(cached_segment, still, frame_counts[i], w, h, master_w, master_h, template_id, overlay, logo_file, threads)
+                    futures[future] = (k, i)
+            for done, future in enumerate(as_completed(futures), 1):
+                k, i = futures[future]
+                segments[k][i], was_cached = future.result()
+                reused += was_cached
+                # Segments own the 70 -> 90 band, the final mux 90 -> 95
+                if progress_callback: progress_callback(70 + int(20 * done / len(futures)), stage="encode")
+        segment_seconds = time.monotonic() - started
+
+        # 2. Concat (stream copy) + audio mix, one output per rendition
+        input_args = []
+        for k in range(len(renditions)):
+            list_path = os.path.join(work_dir, f"r{k}.txt")
+            with open(list_path, "w") as f:
+                f.writelines(f"file '{os.path.abspath(path)}'\n" for path in segments[k])
+            input_args.extend(['-f', 'concat', '-safe', '0', '-i', list_path])
+        audio_inputs, filter_args, audio_nodes = [], [], []
+        if audio:
+            audio_inputs, audio_filter, audio_nodes = _audio_graph(len(renditions), bgm_file, vo_file, bgm_gain, len(renditions))
+            filter_args = ['-filter_complex', audio_filter]
+
+        output_args = []
+        for k, name in enumerate(renditions):
+            audio_args = ['-map', audio_nodes[k], '-c:a', 'aac', '-ar', str(MIX_SAMPLE_RATE)] if audio else ['-an']
+            output_args += [
+                '-map', f'{k}:v', *audio_args, '-c:v', 'copy',
+                '-t', f'{final_dur:.3f}', '-shortest', os.path.join(VIDEO_DIR, rendition_filename(output_name, name, k))
+            ]
+        cmd = ['ffmpeg', '-y', *input_args, *audio_inputs, *filter_args, *output_args]
+
+        def on_mux_progress(fraction, eta, speed):
+            if progress_callback:
+                progress_callback(90 + int(5 * fraction), stage="encode", eta_seconds=round(eta, 1) if eta is not None else None)
+
+        run_ffmpeg(cmd, final_dur, on_progress=on_mux_progress)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    wall = time.monotonic() - started
+    encode_stats = {
+        "wall_seconds": round(wall, 3),
+        "media_seconds": round(float(final_dur), 3),
+        "speed": round(float(final_dur) / wall, 3) if wall > 0 else None,
+        "segments": len(stills) * len(renditions),
+        "segments_reused": reused,
+        "segment_workers": workers,
+        "segment_seconds": round(segment_seconds, 3),
+    }
+    print(f"🎬 Segmented encode took {encode_stats['wall_seconds']}s ({encode_stats['speed']}x realtime)")
+    return encode_stats
+
+# 🚀 MAIN FUNCTION (Robust & Crash Proof)
+def generate_video_from_images(image_urls, product_title, product_desc, logo_url=None, gender="female", 
+                               target_duration=15, script_tone="Professional", custom_music_path=None, 
+                               progress_callback=None, shop_name=None, video_theme="Modern", 
+                               bgm_file_path=None, template_id="none", regenerate=False, render_mode=None,
+                               brand_settings=None, renditions=None):
+    """
+    render_mode "files": every still goes through a JPEG on disk and `-loop 1`.
+    render_mode "stream": each image is decoded once in memory and a single raw
+    frame per segment is piped to ffmpeg (no temp JPEGs, no re-decode by ffmpeg).
+    render_mode "segments": files, but encoded per still in parallel and joined
+    with stream copy (see encode_video_segments()).
+
+    `brand_settings` lets a caller that already loaded the brand kit (batch
+    renders) skip the per-job lookup; `bgm_file_path` is a caller-owned music
+    file that is never deleted here.
+
+    `renditions` lists RENDITIONS names; all of them come out of one ffmpeg run
+    (see rendition_filename() for the file names of the extra outputs).
+    """
+    render_mode = render_mode or RENDER_MODE
+    stream = render_mode == "stream"
+    renditions = resolve_renditions(renditions)
+    master_w, master_h = master_size(renditions)
+    if not os.path.exists(VIDEO_DIR): os.makedirs(VIDEO_DIR)
+    if progress_callback: progress_callback(5, stage="fetch")
+
+    # 1. Brand kit + music bed
+    brand = resolve_brand(shop_name, brand_settings, logo_url)
+    bgm_file, bgm_gain = resolve_music(video_theme, product_title, custom_music_path, bgm_file_path)
+
+    # 2. Downloads and the audio chain (script -> TTS) in parallel
+    images, logo_file, vo_file, script_text = [], None, None, ""
+    with ThreadPoolExecutor(max_workers=1) as exec:
+        future_audio = exec.submit(process_audio_chain, product_title, product_desc, gender, script_tone, target_duration, regenerate)
+        try: images, logo_file = fetch_images(image_urls, brand["logo_url"], (master_w, master_h), as_frame=stream)
+        finally: vo_file, script_text, vo_duration = future_audio.result()
+    downloaded_images = [] if stream else list(images) # (index, path) of files to clean up
+
+    try:
+        if not images: return None, "No Images"
+        if progress_callback: progress_callback(40, stage="compose")
+
+        # 3. Outro
+        stills = [still for _, still in images]
+        if stream:
+            try: stills.append(render_outro_frame(stills[-1], product_title, brand["cta_text"], brand["brand_color"], master_w, master_h))
+            except Exception as e: print(f"⚠️ Outro failed: {e}")
         else:
-            filter_complex += f"[{bgm_idx}:a]volume=0.5[a_out]"
-            audio_map = "[a_out]"
-
-        # 👇 ULTRAFAST COMMAND (No Capture Output = NO STUCK)
-        cmd = [
-            'ffmpeg', '-y', *input_args,
-            '-filter_complex', filter_complex,
-            '-map', last_node, '-map', audio_map,
-            '-c:v', 'libx264', 
-            '-preset', 'ultrafast', 
-            '-tune', 'zerolatency',
-            '-pix_fmt', 'yuv420p', 
-            '-shortest', output_path
-        ]
-        
-        if progress_callback: progress_callback(70)
-        print("🎬 Running FFmpeg (Fast Mode)...")
-        
-        subprocess.run(cmd, check=True) 
-        
-        if progress_callback: progress_callback(95)
+            outro_path = os.path.join(VIDEO_DIR, f"outro_{uuid.uuid4().hex[:6]}.jpg")
+            create_outro_image(stills[-1], product_title, outro_path, cta_text=brand["cta_text"], brand_color=brand["brand_color"], width=master_w, height=master_h)
+            if os.path.exists(outro_path):
+                stills.append(outro_path)
+                downloaded_images.append((999, outro_path))
+
+        # 4. Encode
+        final_dur, img_dur = plan_timing(target_duration, vo_duration if vo_file else 0, len(stills))
+        output_name = f"vid_{uuid.uuid4().hex[:6]}.mp4"
+        encode_args = dict(template_id=template_id, logo_file=logo_file, vo_file=vo_file, bgm_file=bgm_file, bgm_gain=bgm_gain, progress_callback=progress_callback)
+        if render_mode == "segments":
+            encode_stats = encode_video_segments(stills, output_name, final_dur, img_dur, renditions, **encode_args)
+        else:
+            encode_stats = encode_video(stills, output_name, final_dur, img_dur, renditions, stream=stream, **encode_args)
+        if progress_callback: progress_callback(95, stage="encoded", encode_stats=encode_stats)
         return output_name, script_text
 
     except Exception as e:
@@ -366,10 +889,106 @@ def generate_video_from_images(image_urls, product_title, product_desc, logo_url
     finally:
         # Cleanup
         for _, f in downloaded_images: 
-            if os.path.exists(f): os.remove(f)
-        if vo_file and os.path.exists(vo_file): os.remove(vo_file)
-        if bgm_file and os.path.exists(bgm_file) and "bensound" in BGM_URL: os.remove(bgm_file)
-        if logo_file and os.path.exists(logo_file): os.remove(logo_file)
-        if 'generated_overlay' in locals() and generated_overlay and os.path.exists(generated_overlay):
-            os.remove(generated_overlay)
-            
\ No newline at end of file
+            if os.path.exists(f) and not image_cache.owns(f): os.remove(f)
+        if vo_file and os.path.exists(vo_file) and not voice_cache.owns(vo_file): os.remove(vo_file)
+        if custom_music_path and os.path.exists(custom_music_path): os.remove(custom_music_path)
+        if logo_file and os.path.exists(logo_file) and not image_cache.owns(logo_file): os.remove(logo_file)
+
+
+# 🎭 VARIANTS: one visual encode, N audio tracks muxed on with -c:v copy
+def variant_filename(output_name, index):
+    root, ext = os.path.splitext(output_name)
+    return f"{root}_v{index}{ext}"
+
+def mux_audio_variant(video_name, output_name, final_dur, renditions, vo_file=None, bgm_file=None, bgm_gain=1.0):
+    """Puts one audio mix on an already encoded visual track (every rendition, video stream-copied)."""
+    input_args = []
+    for k, name in enumerate(renditions):
+        input_args.extend(['-i', os.path.join(VIDEO_DIR, rendition_filename(video_name, name, k))])
+    audio_inputs, audio_filter, audio_nodes = _audio_graph(len(renditions), bgm_file, vo_file, bgm_gain, len(renditions))
+
+    output_args = []
+    for k, name in enumerate(renditions):
+        output_args += [
+            '-map', f'{k}:v', '-map', audio_nodes[k], '-c:v', 'copy',
+            '-c:a', 'aac', '-ar', str(MIX_SAMPLE_RATE),
+            # Music loops / silence fills in after a short voiceover, so every variant runs the shared length
+            '-t', f"{final_dur:.3f}", '-shortest', os.path.join(VIDEO_DIR, rendition_filename(output_name, name, k))
+        ]
+    cmd = ['ffmpeg', '-y', '-v', 'error', *input_args, *audio_inputs, '-filter_complex', audio_filter, *output_args]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return output_name
+
+def generate_video_variants(image_urls, product_title, product_desc, variants, logo_url=None, target_duration=15,
+                            progress_callback=None, shop_name=None, template_id="none", regenerate=False,
+                            render_mode=None, renditions=None):
+    """
+    `variants` is a list of {"gender", "script_tone", "video_theme"} dicts. The
+    stills are fetched and encoded ONCE (files or segments mode); every
+    variant's script + voiceover is generated concurrently and muxed onto that
+    shared visual track. The timeline is as long as the longest voiceover
+    (capped at target_duration); shorter variants run on music.
+
+    Returns [{"index", "filename", "script", **variant}] (None for variants
+    whose mux failed), or None if the visual encode failed.
+    """
+    render_mode = render_mode or RENDER_MODE
+    renditions = resolve_renditions(renditions)
+    master_w, master_h = master_size(renditions)
+    if progress_callback: progress_callback(5, stage="fetch")
+
+    brand = resolve_brand(shop_name, logo_url=logo_url)
+    images, logo_file = [], None
+    with ThreadPoolExecutor(max_workers=max(1, len(variants))) as exec:
+        audio_futures = [
+            exec.submit(process_audio_chain, product_title, product_desc, v.get("gender", "female"), v.get("script_tone", "Professional"), target_duration, regenerate)
+            for v in variants
+        ]
+        try: images, logo_file = fetch_images(image_urls, brand["logo_url"], (master_w, master_h))
+        finally: audio = [f.result() for f in audio_futures] # (vo_path, script, vo_duration)
+
+    visual_name = f"vid_{uuid.uuid4().hex[:6]}.mp4"
+    outro_path = os.path.join(VIDEO_DIR, f"outro_{uuid.uuid4().hex[:6]}.jpg")
+    try:
+        if not images: return None
+        if progress_callback: progress_callback(40, stage="compose")
+        stills = [path for _, path in images]
+        if create_outro_image(stills[-1], product_title, outro_path, cta_text=brand["cta_text"], brand_color=brand["brand_color"], width=master_w, height=master_h):
+            stills.append(outro_path)
+
+        # 1. Shared visual track (no audio stream at all: each variant muxes its own)
+        longest_vo = max([vo_duration for vo_file, _, vo_duration in audio if vo_file] + [0])
+        final_dur, img_dur = plan_timing(target_duration, longest_vo, len(stills))
+        encode = encode_video_segments if render_mode == "segments" else encode_video
+        encode_stats = encode(stills, visual_name, final_dur, img_dur, renditions, template_id=template_id, logo_file=logo_file,
+                              progress_callback=progress_callback, audio=False)
+        if progress_callback: progress_callback(95, stage="mux", encode_stats=encode_stats)
+
+        # 2. One cheap audio mux per variant, in parallel
+        def mux(index):
+            vo_file, script, _ = audio[index]
+            variant = variants[index]
+            bgm_file, bgm_gain = resolve_music(variant.get("video_theme", "Modern"), f"{product_title}|{index}")
+            output_name = variant_filename(visual_name, index)
+            try: mux_audio_variant(visual_name, output_name, final_dur, renditions, vo_file, bgm_file, bgm_gain)
+            except Exception as e:
+                print(f"❌ Variant {index} mux failed: {e}")
+                return None
+            return {**variant, "index": index, "filename": output_name, "script": script}
+
+        with ThreadPoolExecutor(max_workers=min(len(variants), segment_workers())) as exec:
+            results = list(exec.map(mux, range(len(variants))))
+        print(f"🎭 {sum(r is not None for r in results)}/{len(variants)} variants muxed onto one {encode_stats['wall_seconds']}s encode")
+        return results
+
+    except Exception as e:
+        print(f"❌ Variant render error: {e}")
+        return None
+    finally:
+        for k, name in enumerate(renditions):
+            path = os.path.join(VIDEO_DIR, rendition_filename(visual_name, name, k))
+            if os.path.exists(path): os.remove(path)
+        if os.path.exists(outro_path): os.remove(outro_path)
+        for vo_file, _, _ in audio:
+            if vo_file and os.path.exists(vo_file) and not voice_cache.owns(vo_file): os.remove(vo_file)
+        if logo_file and os.path.exists(logo_file) and not image_cache.owns(logo_file): os.remove(logo_file)
@@ -1,14 +1,51 @@
+import os
 import sys
+import platform
 from tasks import celery_app
 
-# This allows you to run "python worker.py" directly!
-if __name__ == '__main__':
-    print("👷 Starting Windows Celery Worker...")
-    
-    argv = [
+# 👷 Worker profiles. Queues (see task_routes in tasks.py):
+#   cpu     -> ffmpeg renders, one process per core
+#   io      -> downloads / Gemini / batch fan-out, many threads (mostly waiting)
+#   publish -> social uploads
+# Run one "cpu" and one "io" worker per box to keep every core busy while
+# other jobs wait on the network. "solo" keeps the old single-process mode
+# (and is the only pool that works on Windows).
+CORES = os.cpu_count() or 1
+ALL_QUEUES = "celery,cpu,io,publish"
+
+WORKER_PROFILES = {
+    "cpu": {"pool": "prefork", "concurrency": CORES, "queues": "cpu", "prefetch_multiplier": 1},
+    "io": {"pool": "threads", "concurrency": max(8, CORES * 4), "queues": "celery,io,publish", "prefetch_multiplier": 4},
+    "all": {"pool": "prefork", "concurrency": CORES, "queues": ALL_QUEUES, "prefetch_multiplier": 1},
+    "solo": {"pool": "solo", "concurrency": 1, "queues": ALL_QUEUES, "prefetch_multiplier": 1},
+}
+
+def default_profile():
+    return "solo" if platform.system() == "Windows" else "all"
+
+def worker_argv(profile_name=None):
+    """Profile from argv / WORKER_PROFILE; WORKER_POOL, WORKER_CONCURRENCY and WORKER_QUEUES override single settings."""
+    profile_name = profile_name or os.getenv("WORKER_PROFILE") or default_profile()
+    if profile_name not in WORKER_PROFILES:
+        sys.exit(f"Unknown worker profile '{profile_name}' (choose from {', '.join(WORKER_PROFILES)})")
+    profile = WORKER_PROFILES[profile_name]
+
+    pool = os.getenv("WORKER_POOL", profile["pool"])
+    concurrency = int(os.getenv("WORKER_CONCURRENCY", profile["concurrency"]))
+    queues = os.getenv("WORKER_QUEUES", profile["queues"])
+    # Each of the `concurrency` renders gets its share of the cores (inherited by the pool children)
+    os.environ.setdefault("RENDER_CPUS", str(max(1, CORES // concurrency)))
+    print(f"👷 Starting Celery worker: profile={profile_name} pool={pool} concurrency={concurrency} queues={queues} render_cpus={os.environ['RENDER_CPUS']}")
+    return [
         'worker',
-        '--pool=solo',
+        f'--pool={pool}',
+        f'--concurrency={concurrency}',
+        f'--queues={queues}',
+        f'--prefetch-multiplier={profile["prefetch_multiplier"]}',
+        f'--hostname={profile_name}@%h',
         '--loglevel=info'
     ]
-    
-    celery_app.worker_main(argv)
\ No newline at end of file
+
+# This allows you to run "python worker.py [cpu|io|all|solo]" directly!
+if __name__ == '__main__':
+    celery_app.worker_main(worker_argv(sys.argv[1] if len(sys.argv) > 1 else None))